@@ -1,6 +1,26 @@
+import argparse
+import sys
+from batch import ScriptRunner
 from classes import Game
 
 if __name__ == "__main__":
-    game = Game()
-    game.play_game()
+    parser = argparse.ArgumentParser(description="Play Jaipur")
+    parser.add_argument("--script", nargs="*", metavar="FILE",
+                        help="play scripted games from files of commands "
+                             "(or from stdin if no files are given)")
+    parser.add_argument("--errors-only", action="store_true",
+                        help="in script mode, only report errors and results")
+    arguments = parser.parse_args()
 
+    if arguments.script is None:
+        game = Game()
+        game.play_game()
+    else:
+        runner = ScriptRunner(sys.stdout.write, arguments.errors_only)
+        for path in arguments.script or ["-"]:
+            if path == "-":
+                runner.run(sys.stdin)
+            else:
+                with open(path) as file:
+                    runner.run(file)
+        sys.exit(1 if runner.errors else 0)
@@ -0,0 +1,164 @@
+"""Post-game analysis of recorded games.
+
+A game record is a dict with the game's seed, the command strings of every
+move played (Game.history) and, optionally, an id and the house rules:
+    {"id": "game 1", "seed": 123, "moves": ["camels", "buy gold", ...]}
+
+Each game is replayed deterministically through the Game rules. At every
+decision point the position is searched to a configurable depth, and the
+played move is compared with the best move found. The difference in value is
+the move's regret; moves with a large regret are blunders. Games are analysed
+in a process pool and the reports are yielded as soon as they are finished.
+A record that can't be replayed gets an error report instead, e.g.
+    {"id": "game 2", "error": "There is no pineapple in the marketplace.",
+     "move_index": 17}
+and the other games are analysed as usual.
+
+Analyse a file of JSON lines records with:
+    python analysis.py games.jsonl report.jsonl --depth 2
+"""
+import argparse
+import json
+from multiprocessing import Pool
+from bots import SearchBot
+from classes import Game
+from exceptions import IllegalMoveError, InvalidInputError
+from utilities import format_move, parse_player_input
+
+
+def game_record(game, id=None):
+    """Record of a seeded game, for analysis or replay"""
+    if game.seed is None:
+        raise ValueError("Only seeded games can be replayed")
+    return {"id": id, "seed": game.seed, "moves": list(game.history),
+            "rules": {"deck": game.deck_contents,
+                      "resource_tokens": game.resource_schedule,
+                      "bonus_tokens": game.bonus_schedule}}
+
+
+def check_record(record):
+    """Raise ValueError unless a decoded record has the shape of a game
+    record"""
+    if not isinstance(record, dict):
+        raise ValueError("A game record must be an object")
+    if record.get("seed") is None:
+        raise ValueError("Only seeded games can be replayed")
+    moves = record.get("moves")
+    if not isinstance(moves, list) or \
+            not all(isinstance(command, str) for command in moves):
+        raise ValueError("The moves must be a list of commands")
+    rules = record.get("rules", {})
+    if not isinstance(rules, dict) or \
+            not set(rules) <= {"deck", "resource_tokens", "bonus_tokens"}:
+        raise ValueError("The rules must be deck, resource_tokens and/or "
+                         "bonus_tokens")
+
+
+def replay(record):
+    """Replay a recorded game. The record is checked and the game set up
+    straight away; the returned generator yields the game, the player to move
+    and the move they played before each move, and raises IllegalMoveError if
+    the record has moves left once the game is over. The game is live:
+    anything done to it while the generator is suspended must be undone
+    before resuming."""
+    check_record(record)
+    game = Game(seed=record["seed"], verbose=False, **record.get("rules", {}))
+    game.setup_round()
+
+    def moves():
+        live = True
+        for command in record["moves"]:
+            if not live:
+                raise IllegalMoveError("The game is over")
+            player = game.players[game.current_player % 2]
+            move = parse_player_input(command)
+            yield game, player, move
+            game.play_move(player, move)
+            live = game.next_turn()
+
+    return moves()
+
+
+def move_key(move):
+    """Command string of a move, independent of the order cards are listed"""
+    action, *details = move
+    return format_move((action, *(sorted(detail) if isinstance(detail, list)
+                                  else detail for detail in details)))
+
+
+def analyse_game(job):
+    """Analyse every move of a recorded game (a dict, or a line of JSON).
+    Runs in a worker process."""
+    record, depth, blunder_threshold = job
+    try:
+        if isinstance(record, str):
+            record = json.loads(record)
+        moves_played = replay(record)
+    except (TypeError, ValueError) as e:
+        return {"id": record.get("id") if isinstance(record, dict) else None,
+                "error": f"Invalid game record ({type(e).__name__}: {e})",
+                "move_index": None}
+    analyst = SearchBot("analyst", seed=record["seed"], depth=depth)
+    moves = []
+    game = None
+    try:
+        for game, player, move in moves_played:
+            candidates = game.legal_moves(player)
+            keys = [move_key(candidate) for candidate in candidates]
+            if move_key(move) not in keys:
+                candidates.append(move)
+                keys.append(move_key(move))
+            values = analyst.move_values(game, player, candidates)
+            best_move, best_value = max(values, key=lambda value: value[1])
+            played_value = values[keys.index(move_key(move))][1]
+            regret = best_value - played_value
+            moves.append({"round": game.round,
+                          "player": player.name,
+                          "move": format_move(move),
+                          "best_move": format_move(best_move),
+                          "regret": regret,
+                          "blunder": regret >= blunder_threshold,
+                          })
+    except (IllegalMoveError, InvalidInputError) as e:
+        # only moves that were played successfully are in the history
+        return {"id": record.get("id"), "error": str(e),
+                "move_index": 0 if game is None else len(game.history)}
+    total_regret = {}
+    for move in moves:
+        total_regret[move["player"]] = (total_regret.get(move["player"], 0)
+                                        + move["regret"])
+    return {"id": record.get("id"), "moves": moves,
+            "total_regret": total_regret,
+            "blunders": sum(move["blunder"] for move in moves)}
+
+
+def analyse(records, depth=1, blunder_threshold=5, processes=None):
+    """Analyse an iterable of game records in a process pool, yielding a
+    report for each game as soon as it is finished (not necessarily in the
+    order of the records)"""
+    jobs = ((record, depth, blunder_threshold) for record in records)
+    with Pool(processes) as pool:
+        yield from pool.imap_unordered(analyse_game, jobs)
+
+
+def analyse_file(in_path, out_path, **kwargs):
+    """Analyse a file of JSON lines game records, writing a JSON lines report
+    for each game as it finishes. Lines are decoded by the workers, so a
+    malformed line only produces an error report."""
+    with open(in_path) as records, open(out_path, "w") as reports:
+        lines = (line for line in records if line.strip())
+        for report in analyse(lines, **kwargs):
+            reports.write(json.dumps(report) + "\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analyse recorded games")
+    parser.add_argument("records")
+    parser.add_argument("reports")
+    parser.add_argument("--depth", type=int, default=1)
+    parser.add_argument("--blunder-threshold", type=float, default=5)
+    parser.add_argument("--processes", type=int, default=None)
+    arguments = parser.parse_args()
+    analyse_file(arguments.records, arguments.reports, depth=arguments.depth,
+                 blunder_threshold=arguments.blunder_threshold,
+                 processes=arguments.processes)
@@ -0,0 +1,107 @@
+"""Non-interactive mode: play scripted games from files of commands.
+
+A script holds any number of games. Each game starts with a seed line and is
+followed by one command per line, played by whoever's turn it is:
+    seed 42
+    camels
+    buy gold
+    sell 2 gold
+    ...
+Blank lines and lines starting with # are ignored. For every command one
+compact line is written: "ok", or an error if it couldn't be played (the same
+player then stays to move, as in the interactive game). Errors give the
+game's number (counting from 1 across the whole run, 0 outside a game) and
+the line's number in its script, so problems can be found in large files:
+    error 3:127: There is no pineapple in the marketplace.
+After each game, a result line gives both players' victory points and the
+winner:
+    result 2 1 Player 1
+Nothing is printed by the games themselves, and output is written in large
+chunks, so many thousands of recorded games can be checked in one process.
+"""
+from classes import Game
+from exceptions import InvalidInputError, IllegalMoveError
+from utilities import parse_player_input
+
+
+def parse_seed(text):
+    return int(text) if text.lstrip("-").isdigit() else text
+
+
+class ScriptRunner():
+    def __init__(self, write, errors_only=False, buffer_lines=10000):
+        """Play scripted games, passing output to `write` (e.g.
+        sys.stdout.write). If errors_only is True, "ok" lines are left out.
+        """
+        self.write = write
+        self.errors_only = errors_only
+        self.buffer_lines = buffer_lines
+        self.buffer = []
+        self.game = None
+        self.game_over = False
+        self.games = 0
+        self.errors = 0
+        self.line_number = 0  # in the current script
+
+    def output(self, line):
+        self.buffer.append(line)
+        if len(self.buffer) >= self.buffer_lines:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.write("\n".join(self.buffer) + "\n")
+            self.buffer = []
+
+    def error(self, message):
+        self.errors += 1
+        game = 0 if self.game is None else self.games
+        self.output(f"error {game}:{self.line_number}: {message}")
+
+    def start_game(self, seed):
+        self.end_game()
+        self.game = Game(seed=seed, verbose=False)
+        self.game.setup_round()
+        self.game_over = False
+        self.games += 1
+
+    def end_game(self):
+        if self.game is None:
+            return
+        player1, player2 = self.game.players
+        winner = self.game.winner()
+        self.output(f"result {player1.victory_points} {player2.victory_points} "
+                    f"{'none' if winner is None else winner.name}")
+        self.game = None
+
+    def play_line(self, line):
+        self.line_number += 1
+        line = line.strip()
+        if not line or line.startswith("#"):
+            return
+        if line.startswith("seed"):
+            self.start_game(parse_seed(line[len("seed"):].strip()))
+            return
+        if self.game is None:
+            self.error("no game started (expected a seed line)")
+            return
+        if self.game_over:
+            self.error("the game is over")
+            return
+        player = self.game.players[self.game.current_player % 2]
+        try:
+            self.game.play_move(player, parse_player_input(line))
+        except (IllegalMoveError, InvalidInputError) as e:
+            self.error(str(e))
+            return
+        self.game_over = not self.game.next_turn()
+        if not self.errors_only:
+            self.output("ok")
+
+    def run(self, lines):
+        """Play every line of a script, then finish the last game"""
+        self.line_number = 0
+        for line in lines:
+            self.play_line(line)
+        self.end_game()
+        self.flush()
@@ -0,0 +1,158 @@
+from math import inf
+from time import perf_counter
+from classes import Bot
+from exceptions import OutOfTimeError
+
+# average value of the bonus token awarded for selling this many goods
+bonus_values = {3: 2.0, 4: 5.0, 5: 9.0}
+
+
+def top_token_value(game, goods):
+    """Value of the next token on the goods stack (0 if it's empty)"""
+    stack = game.resource_tokens.get(goods)
+    return stack[-1].value if stack else 0
+
+
+def sale_value(game, goods, amount):
+    """Points the player would get for selling this many goods right now"""
+    tokens = game.resource_tokens[goods].peek(amount) if amount else []
+    bonus = bonus_values[min(amount, 5)] if amount >= 3 else 0
+    return sum(token.value for token in tokens) + bonus
+
+
+class RandomBot(Bot):
+    """Plays a uniformly random legal move"""
+
+    def choose_move(self, game):
+        return self.random.choice(game.legal_moves(self))
+
+
+class GreedyBot(Bot):
+    """Plays the move with the best immediate heuristic value. Ties are
+    broken randomly."""
+
+    def score_move(self, game, move):
+        action, *details = move
+        if action == "sell":
+            goods, amount = details
+            return sale_value(game, goods, amount)
+        elif action == "buy":
+            goods, = details
+            return 0.5 * top_token_value(game, goods)
+        elif action == "camels":
+            return 0.4 * game.marketplace.count("camel")
+        elif action == "trade":
+            player_cards, market_cards = details
+            gained = sum(top_token_value(game, card) for card in market_cards)
+            lost = sum(top_token_value(game, card) for card in player_cards
+                       if card != "camel")
+            return 0.5 * (gained - lost) - 0.25 * len(market_cards)
+        return 0
+
+    def choose_move(self, game):
+        moves = game.legal_moves(self)
+        self.random.shuffle(moves)
+        return max(moves, key=lambda move: self.score_move(game, move))
+
+
+class SearchBot(GreedyBot):
+    """Looks `depth` moves ahead (alternating between itself and the
+    opponent) using make_move/unmake_move on the live game, so no game states
+    are copied. The deck is shuffled for the duration of the search, so the
+    bot can't see which cards will be drawn, and restored afterwards."""
+
+    def __init__(self, name, seed=None, depth=2):
+        super().__init__(name, seed=seed)
+        self.depth = depth
+
+    def evaluate(self, game, player):
+        """Heuristic value of the position for `player`: token points plus
+        half the value of the goods in hand, relative to the opponent"""
+        value = 0
+        for sign, someone in ((1, player), (-1, game.opponent(player))):
+            hand = sum(top_token_value(game, card) for card in someone.hand)
+            value += sign * (someone.points + 0.5 * hand
+                             + 0.2 * len(someone.herd))
+        return value
+
+    def search(self, game, player, depth):
+        if self.deadline is not None and perf_counter() > self.deadline:
+            raise OutOfTimeError
+        if depth == 0 or game.check_for_game_over():
+            return self.evaluate(game, player)
+        opponent = game.opponent(player)
+        best = -inf
+        for move in game.legal_moves(player):
+            undo = game.make_move(player, move)
+            try:
+                value = -self.search(game, opponent, depth - 1)
+            finally:
+                game.unmake_move(undo)
+            best = max(best, value)
+        return best
+
+    def choose_move(self, game):
+        values = self.move_values(game, self)
+        return max(values, key=lambda move_value: move_value[1])[0]
+
+    def think(self, game):
+        """Iterative deepening. After each root move is searched, yield the
+        best move of the deepest completed search (or, during the first
+        search, the best move so far). Stops when the deadline passes."""
+        deck = game.deck[:]
+        game.deck.shuffle(self.random)
+        try:
+            moves = game.legal_moves(self)
+            self.random.shuffle(moves)
+            best = None
+            for depth in range(1, self.depth + 1):
+                values = []
+                for move in moves:
+                    values.extend(self.search_moves(game, self, [move], depth))
+                    if best is None:
+                        yield max(values, key=lambda value: value[1])[0]
+                    else:
+                        yield best
+                # search the most promising moves first next time
+                values.sort(key=lambda value: value[1], reverse=True)
+                moves = [move for move, __ in values]
+                best = moves[0]
+                yield best
+        except OutOfTimeError:
+            return
+        finally:
+            game.deck[:] = deck
+
+    def move_values(self, game, player, moves=None, depth=None, rng=None):
+        """List (move, value) for the player's legal moves (or the given
+        moves), searching `depth` moves ahead (default: the bot's depth).
+        The deck and the moves are shuffled with `rng` (default: the bot's
+        random number generator)."""
+        rng = self.random if rng is None else rng
+        deck = game.deck[:]
+        game.deck.shuffle(rng)
+        try:
+            if moves is None:
+                moves = game.legal_moves(player)
+                rng.shuffle(moves)
+            return self.search_moves(game, player, moves,
+                                     self.depth if depth is None else depth)
+        finally:
+            game.deck[:] = deck
+
+    def search_moves(self, game, player, moves, depth):
+        opponent = game.opponent(player)
+        values = []
+        for move in moves:
+            undo = game.make_move(player, move)
+            try:
+                values.append((move, -self.search(game, opponent, depth - 1)))
+            finally:
+                game.unmake_move(undo)
+        return values
+
+# registry of bots by name, e.g. for choosing bots from the command line
+BOTS = {"random": RandomBot,
+        "greedy": GreedyBot,
+        "search": SearchBot,
+        }
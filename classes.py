@@ -1,10 +1,25 @@
-from random import shuffle
+from copy import copy
+from random import Random, shuffle
 from exceptions import InvalidInputError, IllegalMoveError
-from utilities import parse_player_input
+from utilities import parse_player_input, format_move, sub_multisets
 
 allowed_token_names = ("diamond", "silver", "gold", "cloth", "spice",
                        "leather", "combo3", "combo4", "combo5", "largest_herd",
                        )
+precious_goods = ("diamond", "gold", "silver")
+
+# default token values for each round, from the bottom of each stack to the top
+default_resource_tokens = {"diamond": [5, 5, 5, 7, 7],
+                           "gold": [5, 5, 5, 6, 6],
+                           "silver": [5, 5, 5, 5, 5],
+                           "leather": [1, 1, 1, 1, 1, 1, 2, 3, 4],
+                           "cloth": [1, 1, 2, 2, 3, 3, 5],
+                           "spice": [1, 1, 2, 2, 3, 3, 5],
+                           }
+default_bonus_tokens = {"combo3": [1, 1, 2, 2, 2, 3, 3],
+                        "combo4": [4, 4, 5, 5, 6, 6],
+                        "combo5": [8, 8, 9, 10, 10],
+                        }
 
 
 class Token():
@@ -49,8 +64,13 @@ class Deck(list):
             temp.extend([goods] * amount)
         super().__init__(temp)
 
-    def shuffle(self):
-        shuffle(self)
+    def shuffle(self, rng=None):
+        """Shuffle in place, using the random.Random instance `rng` if one is
+        given (for reproducible games) or the global random module if not."""
+        if rng is None:
+            shuffle(self)
+        else:
+            rng.shuffle(self)
 
     def draw(self, number=1):
         """Draw the next card(s)"""
@@ -160,10 +180,14 @@ class Player():
                 return card
         return False
 
+    def location(self, card):
+        """The player's herd if card is "camel"; the player's hand otherwise"""
+        return self.herd if card == "camel" else self.hand
+
     def count(self, card):
         """Count how many the player has of a single resource card. Checks
         player herd if card is "camel"; checks hand otherwise. """
-        return (self.herd if card == "camel" else self.hand).count(card)
+        return self.location(card).count(card)
 
     def take(self, cards):
         """Take cards from the player's hand or herd, depending on the card
@@ -191,42 +215,113 @@ class Player():
         return sum(token.value for token in self.tokens)
 
 
+class Bot(Player):
+    """A computer-controlled player. Instead of being prompted for input, the
+    game asks the bot to choose a move (a parsed move tuple, as returned by
+    parse_player_input) given the current state of the game.
+    Subclasses should implement choose_move."""
+
+    def __init__(self, name, seed=None):
+        super().__init__(name)
+        self.random = Random(seed)
+        self.deadline = None  # time.perf_counter() deadline, set by a clock
+
+    def choose_move(self, game):
+        raise NotImplementedError
+
+    def think(self, game):
+        """Anytime interface: yield successively better moves until there is
+        nothing left to improve. When the game has a clock, it stops asking
+        (closes the generator) once the turn's time is up and plays the last
+        move yielded in time. While thinking, self.deadline is set, so long
+        computations can stop early. By default, just yields choose_move's
+        move."""
+        yield self.choose_move(game)
+
+    def stand_in(self, game):
+        """Copy of the bot that thinks about `game` in a worker thread, with
+        its own random number generator. Bots whose think() changes other
+        state settle it here, on the real bot, and give the copy what it
+        needs."""
+        bot = copy(self)
+        bot.random = Random(self.random.random())
+        return bot
+
+    def start_pondering(self, game):
+        """Called when the opponent (a human) starts thinking about their
+        move. Bots can use the time to prepare their reply."""
+
+    def stop_pondering(self):
+        """Called as soon as the opponent has answered"""
+
+
 class Game():
-    def __init__(self):
-        """Setup actions at the very beginning of the game"""
+    def __init__(self, player1=None, player2=None, seed=None, verbose=True,
+                 deck=None, resource_tokens=None, bonus_tokens=None,
+                 clock=None):
+        """Setup actions at the very beginning of the game.
+        Players default to human players. If a seed is given, the shuffles
+        for every round are reproducible. If verbose is False, nothing is
+        printed (useful for bot games).
+        House rules can be set with `deck` (card counts overriding the default
+        deck), and `resource_tokens` / `bonus_tokens` (token values overriding
+        the default schedules for the given stacks).
+        If a clock (see clock.TurnClock) is given, bots' moves are subject to
+        its deadlines."""
         # create players
-        self.player1 = Player(name="Player 1")
-        self.player2 = Player(name="Player 2")
+        self.player1 = Player(name="Player 1") if player1 is None else player1
+        self.player2 = Player(name="Player 2") if player2 is None else player2
         self.players = self.player1, self.player2
         self.current_player = 0
+        self.seed = seed
+        self.round = 0
+        self.history = []  # command strings of the moves played so far
+        self.round_start = 0  # number of moves played before this round
+        self.observers = []  # called with the game after every state change
+        self.clock = clock
+        self.verbose = verbose
+        self.deck_contents = dict(deck or {})
+        self.resource_schedule = {**default_resource_tokens,
+                                  **(resource_tokens or {})}
+        self.bonus_schedule = {**default_bonus_tokens, **(bonus_tokens or {})}
+
+    def say(self, *args):
+        if self.verbose:
+            print(*args)
+
+    def notify(self):
+        for observer in self.observers:
+            observer(self)
+
+    def round_random(self):
+        """Random number generator for the current round. Derived from the
+        game seed and round number, so a seeded game can be replayed."""
+        if self.seed is None:
+            return Random()
+        return Random(f"{self.seed}:{self.round}")
+
+    def opponent(self, player):
+        return self.player2 if player is self.player1 else self.player1
 
     def setup_round(self):
         """Setup actions at the start of each round"""
+        self.round += 1
+        self.round_start = len(self.history)
+        rng = self.round_random()
         # create token piles
-        # populate tokens dictionary
-        self.resource_tokens = {"diamond": [5, 5, 5, 7, 7],
-                                "gold": [5, 5, 5, 6, 6],
-                                "silver": [5, 5, 5, 5, 5],
-                                "leather": [1, 1, 1, 1, 1, 1, 2, 3, 4],
-                                "cloth": [1, 1, 2, 2, 3, 3, 5],
-                                "spice": [1, 1, 2, 2, 3, 3, 5],
-                                }
-        self.bonus_tokens = {"combo3": [1, 1, 2, 2, 2, 3, 3],
-                             "combo4": [4, 4, 5, 5, 6, 6],
-                             "combo5": [8, 8, 9, 10, 10],
-                             }
-
-        # convert values to TokenStacks
-        for key, values in self.resource_tokens.items():
+        # convert scheduled values to TokenStacks
+        self.resource_tokens = {}
+        for key, values in self.resource_schedule.items():
             self.resource_tokens[key] = TokenStack(*(Token(key, v) for v in values))
             self.resource_tokens[key].sort_by_value()
-        for key, values in self.bonus_tokens.items():
+        self.bonus_tokens = {}
+        for key, values in self.bonus_schedule.items():
             self.bonus_tokens[key] = TokenStack(*(Token(key, v) for v in values))
-            self.bonus_tokens[key].shuffle()
+            self.bonus_tokens[key].shuffle(rng)
 
         # create deck
-        self.deck = Deck(default=True)
-        self.deck.shuffle()
+        self.deck = Deck(default=True, **self.deck_contents)
+        self.deck.shuffle(rng)
 
         # create marketplace/river (always start with 3 camels)
         camels = self.deck.take("camel", 3)
@@ -237,6 +332,7 @@ class Game():
         for player in self.players:
             player.reset()
             player.give(self.deck.draw(4))  # deal player hands
+        self.notify()
 
     def check_for_game_over(self):
         # has the market run out of cards?
@@ -260,10 +356,19 @@ class Game():
         return input(message).strip()
 
     def refill_marketplace(self):
+        """Refill the marketplace from the deck. Returns the number of cards
+        drawn (they are appended to the end of the marketplace)."""
+        before = len(self.marketplace)
         while len(self.marketplace) < 5:
             self.marketplace.extend(self.deck.draw())
             if len(self.deck) == 0:
                 break
+        return len(self.marketplace) - before
+
+    def unrefill_marketplace(self, drawn):
+        """Put the last `drawn` marketplace cards back on top of the deck"""
+        for __ in range(drawn):
+            self.deck.append(self.marketplace.pop())
 
     def buy(self, player, card):
         # player hand size can't exceed 7
@@ -279,8 +384,10 @@ class Game():
             raise IllegalMoveError(f"There is no {card} in the marketplace.")
 
         # take card from marketplace into player hand
+        index = self.marketplace.index(card)
         player.hand.extend(self.marketplace.take(card))
-        self.refill_marketplace()
+        drawn = self.refill_marketplace()
+        return "buy", player, card, index, drawn
 
     def sell(self, player, goods, amount):
         if amount == "all":
@@ -297,17 +404,25 @@ class Game():
             raise IllegalMoveError(f"You can't sell less than 2 {goods}")
 
         # remove the cards from the player's hand
+        positions = [i for i, card in enumerate(player.hand)
+                     if card == goods][:amount]
         player.hand.take(goods, amount)
         # take tokens from the token pile and add to player tokens
-        player.tokens.extend(self.resource_tokens[goods].draw(amount))
+        tokens = self.resource_tokens[goods].draw(amount)
+        player.tokens.extend(tokens)
 
         # handle combo tokens for large trades
+        bonus = None
         if amount == 3:
-            player.tokens.extend(self.bonus_tokens["combo3"].draw())
+            bonus = "combo3"
         if amount == 4:
-            player.tokens.extend(self.bonus_tokens["combo4"].draw())
+            bonus = "combo4"
         if amount >= 5:
-            player.tokens.extend(self.bonus_tokens["combo5"].draw())
+            bonus = "combo5"
+        bonus_tokens = self.bonus_tokens[bonus].draw() if bonus else []
+        player.tokens.extend(bonus_tokens)
+        return ("sell", player, goods, positions, len(tokens), bonus,
+                len(bonus_tokens))
 
     def trade(self, player, player_cards, market_cards):
         # check card lists are equal length
@@ -336,105 +451,234 @@ class Game():
             raise IllegalMoveError("Your hand will be greater than 7 cards "
                                    "after this trade")
 
-        # take the cards out of the player's hand (or herd, if camel)
-        player.take(player_cards)
-        # do the market trade
-        self.marketplace.trade(player_cards, market_cards)
+        # take the cards out of the player's hand (or herd, if camel),
+        # remembering where each one came from
+        positions = []
+        for card in player_cards:
+            positions.append(player.location(card).index(card))
+            player.take(card)
+        # do the market trade (one swap at a time, remembering the slots)
+        slots = []
+        for player_card, market_card in zip(player_cards, market_cards):
+            slots.append(self.marketplace.index(market_card))
+            self.marketplace.swap(player_card, market_card)
         # give market cards to player
         player.give(market_cards)
+        return "trade", player, player_cards, market_cards, positions, slots
 
     def take_camels(self, player):
         if self.marketplace.count("camel") == 0:
             raise IllegalMoveError("There are no camels in the marketplace. "
                                    "Try another action.")
+        slots = [i for i, card in enumerate(self.marketplace) if card == "camel"]
         player.give(self.marketplace.take_camels())
-        self.refill_marketplace()
-
-    def player_turn(self):
-        # get current player
-        player = self.players[self.current_player % 2]
-
-        # prompt player for action
-        inp = self.prompt_player_turn(player)
-        action, *details = parse_player_input(inp)
-
-        # make arrangements for the player's request
+        drawn = self.refill_marketplace()
+        return "camels", player, slots, drawn
+
+    def legal_moves(self, player):
+        """List every legal move for the player, as parsed move tuples in the
+        same form as parse_player_input returns."""
+        moves = []
+        market_goods = [card for card in self.marketplace if card != "camel"]
+        # buy
+        if len(player.hand) < 7:
+            moves.extend(("buy", card) for card in sorted(set(market_goods)))
+        # sell
+        for goods in sorted(set(player.hand)):
+            minimum = 2 if goods in precious_goods else 1
+            for amount in range(minimum, player.count(goods) + 1):
+                moves.append(("sell", goods, amount))
+        # camels
+        if "camel" in self.marketplace:
+            moves.append(("camels",))
+        # trade (never give away a card type you are also taking)
+        offer = sorted(player.hand + player.herd)
+        for size in range(2, min(len(market_goods), len(offer)) + 1):
+            for market_cards in sub_multisets(sorted(market_goods), size):
+                taken = set(market_cards)
+                tradeable = [card for card in offer if card not in taken]
+                for player_cards in sub_multisets(tradeable, size):
+                    camels = player_cards.count("camel")
+                    if len(player.hand) + camels > 7:
+                        continue
+                    moves.append(("trade", player_cards, market_cards))
+        return moves
+
+    def make_move(self, player, move):
+        """Carry out a parsed move tuple on behalf of the player. Returns an
+        undo record which can be passed to unmake_move to take the move back.
+        """
+        action, *details = move
         if action == "buy":
             goods, = details
-            self.buy(player, goods)
+            return self.buy(player, goods)
         elif action == "trade":
             player_cards, market_cards = details
-            self.trade(player, player_cards, market_cards)
+            return self.trade(player, player_cards, market_cards)
         elif action == "sell":
             goods, amount = details
-            self.sell(player, goods, amount)
+            return self.sell(player, goods, amount)
         elif action == "camels":
-            self.take_camels(player)
+            return self.take_camels(player)
         else:
-            raise InvalidInputError(f"Unrecognised input: {inp}")
+            raise InvalidInputError(f"Unrecognised action: {action}")
+
+    def play_move(self, player, move):
+        """Make a move for real: like make_move, but the move is also recorded
+        in the game's history. Returns the undo record."""
+        undo = self.make_move(player, move)
+        self.history.append(format_move(move))
+        return undo
+
+    def unmake_move(self, undo):
+        """Exactly reverse a move, given the undo record returned by
+        make_move. Moves must be unmade in the reverse order they were made.
+        This lets a search explore moves on a single game without copying it.
+        """
+        action, player, *details = undo
+        if action == "buy":
+            card, index, drawn = details
+            self.unrefill_marketplace(drawn)
+            player.hand.pop()
+            self.marketplace.insert(index, card)
+        elif action == "sell":
+            goods, positions, tokens, bonus, bonus_tokens = details
+            if bonus_tokens:
+                self.bonus_tokens[bonus].append(player.tokens.pop())
+            stack = self.resource_tokens[goods]
+            for __ in range(tokens):
+                stack.append(player.tokens.pop())
+            for position in positions:
+                player.hand.insert(position, goods)
+        elif action == "trade":
+            player_cards, market_cards, positions, slots = details
+            del player.hand[len(player.hand) - len(market_cards):]
+            for slot, card in zip(reversed(slots), reversed(market_cards)):
+                self.marketplace[slot] = card
+            for position, card in zip(reversed(positions),
+                                      reversed(player_cards)):
+                player.location(card).insert(position, card)
+        elif action == "camels":
+            slots, drawn = details
+            self.unrefill_marketplace(drawn)
+            del player.herd[len(player.herd) - len(slots):]
+            for slot in slots:
+                self.marketplace.insert(slot, "camel")
+        else:
+            raise InvalidInputError(f"Unrecognised action: {action}")
+
+    def player_turn(self):
+        # get current player
+        player = self.players[self.current_player % 2]
+
+        # prompt player for action
+        if isinstance(player, Bot) and self.clock is not None:
+            move = self.clock.choose_move(self, player)
+        elif isinstance(player, Bot):
+            move = player.choose_move(self)
+        else:
+            opponent = self.opponent(player)
+            if isinstance(opponent, Bot):
+                opponent.start_pondering(self)
+            try:
+                inp = self.prompt_player_turn(player)
+            finally:
+                if isinstance(opponent, Bot):
+                    opponent.stop_pondering()
+            move = parse_player_input(inp)
 
         # execute player requests
+        self.play_move(player, move)
         return True  # turn satisfactorily resolved
 
-    def play_round(self):
-        self.setup_round()
+    def play_turns(self):
+        """Play turns until the round is over"""
         while self.check_for_game_over() is not True:
             response = ""
             while response is not True:
-                print(self)  # print the board
+                self.say(self)  # print the board
                 if response:
-                    print(">"*90+"\n"+response+"\n"+">"*90)
+                    self.say(">"*90+"\n"+response+"\n"+">"*90)
                 try:
                     response = self.player_turn()  # play out player turn
                 except (IllegalMoveError, InvalidInputError) as e:
                     response = str(e)
             self.current_player += 1  # increment current player
+            self.notify()
+
+    def next_turn(self):
+        """Hand over to the next player, for games driven one move at a time.
+        If that ends the round, score it and set up the next round unless the
+        game is over. Returns False once the game is over."""
+        self.current_player += 1
+        self.notify()
+        if self.check_for_game_over() is not True:
+            return True
+        self.end_round()
+        if self.winner() is None and self.round < 3:
+            self.setup_round()
+            return True
+        return False
 
-        print("END OF THE ROUND!")
+    def end_round(self):
+        self.say("END OF THE ROUND!")
         # after round has finished,
         # award the largest herd token
         player1_herd_size = len(self.player1.herd)
         player2_herd_size = len(self.player2.herd)
         if player1_herd_size > player2_herd_size:
-            print("Player 1 has the largest herd and gets 5 points")
+            self.say("Player 1 has the largest herd and gets 5 points")
             self.player1.tokens.append(Token("largest_herd", 5))
         else:
-            print("Player 2 has the largest herd and gets 5 points")
+            self.say("Player 2 has the largest herd and gets 5 points")
             self.player2.tokens.append(Token("largest_herd", 5))
 
         # count token points
         player1_points = self.player1.points
         player2_points = self.player2.points
-        print(f"{self.player1.name} has {player1_points} points")
-        print(f"{self.player2.name} has {player2_points} points")
+        self.say(f"{self.player1.name} has {player1_points} points")
+        self.say(f"{self.player2.name} has {player2_points} points")
 
         # award victory points
         if player1_points > player2_points:
             self.player1.victory_points += 1
-            print(f"{self.player1.name} wins this round.")
+            self.say(f"{self.player1.name} wins this round.")
         elif player1_points < player2_points:
             self.player2.victory_points += 1
-            print(f"{self.player2.name} wins this round.")
+            self.say(f"{self.player2.name} wins this round.")
         else:
             self.player1.victory_points += 1
             self.player2.victory_points += 1
-            print(f"It's a draw! Both players get a victory point.")
+            self.say(f"It's a draw! Both players get a victory point.")
+        self.notify()
 
-    def play_game(self):
-        print("ROUND 1!")
-        self.play_round()
-        print("ROUND 2!")
-        self.play_round()
+    def play_round(self):
+        self.setup_round()
+        self.play_turns()
+        self.end_round()
+
+    def winner(self):
+        """Return the player with 2 victory points, or None"""
         for player in self.players:
             if player.victory_points == 2:
-                print(f"THE WINNER IS {player.name.upper()}!")
-                return None
-        print("ROUND 3!")
+                return player
+        return None
+
+    def play_game(self):
+        """Play up to three rounds and return the winning player (None if
+        nobody won)"""
+        self.say("ROUND 1!")
         self.play_round()
-        for player in self.players:
-            if player.victory_points == 2:
-                print(f"THE WINNER IS {player.name.upper()}!")
-                return None
+        self.say("ROUND 2!")
+        self.play_round()
+        winner = self.winner()
+        if winner is None:
+            self.say("ROUND 3!")
+            self.play_round()
+            winner = self.winner()
+        if winner is not None:
+            self.say(f"THE WINNER IS {winner.name.upper()}!")
+        return winner
 
     def __repr__(self):
         diamond = "{:<10}".format("diamond:")+"{:<20}".format(str(self.resource_tokens["diamond"]))
@@ -0,0 +1,128 @@
+"""Time control for bots.
+
+A TurnClock gives every bot a deadline for each move (the smaller of the
+per-move time and what is left in its time bank). The bot is asked to think
+(Bot.think) and the last move it came up with before the deadline is
+played. If it doesn't come up with one in time, a fallback move is played
+instead.
+
+By default thinking is cooperative: the clock stops asking once the deadline
+has passed, and bots can check their `deadline` attribute to stop long
+computations early (SearchBot does). A bot that takes long between yields
+overruns; that time still comes out of its bank, and is recorded. So the
+deadline is only kept by bots that yield (or check their deadline) often.
+
+With threads=True the clock doesn't rely on that: the bot thinks in a worker
+thread and the clock stops waiting at the deadline. The thread works on a
+stand-in for the bot (Bot.stand_in: a copy with its own cards and random
+number generator) playing a copy of the game, so a bot that is still thinking
+when it is abandoned can't change the live game. Its thread runs on in the
+background until the bot next yields or checks its deadline.
+"""
+from statistics import quantiles
+from threading import Thread
+from time import perf_counter
+from serialization import encode_game, decode_game
+
+
+def first_legal_move(game, player):
+    return game.legal_moves(player)[0]
+
+
+def collect_thoughts(player, game, deadline, thoughts):
+    """Append the moves the bot comes up with to `thoughts`, until the
+    deadline passes"""
+    generator = player.think(game)
+    try:
+        for thought in generator:
+            if perf_counter() > deadline:
+                break  # this answer came too late
+            thoughts.append(thought)
+    finally:
+        generator.close()
+
+
+def stand_in(game, player):
+    """Copies of the bot and the game, for thinking in another thread"""
+    bot = player.stand_in(game)
+    seats = [bot if seat is player else None for seat in game.players]
+    return bot, decode_game(encode_game(game), *seats)
+
+
+class AgentStats():
+    """Timing statistics for one agent"""
+
+    def __init__(self):
+        self.times = []
+        self.fallbacks = 0
+        self.overruns = 0
+
+    def summary(self):
+        times = sorted(self.times)
+        percentiles = (quantiles(times, n=100, method="inclusive")
+                       if len(times) > 1 else times * 99)
+        return {"moves": len(times),
+                "total": sum(times),
+                "mean": sum(times) / len(times) if times else 0,
+                "p50": percentiles[49] if times else 0,
+                "p95": percentiles[94] if times else 0,
+                "max": times[-1] if times else 0,
+                "fallbacks": self.fallbacks,
+                "overruns": self.overruns,
+                }
+
+
+class TurnClock():
+    def __init__(self, move_time=1.0, time_bank=60.0, increment=0.0,
+                 fallback=first_legal_move, threads=False):
+        """Each bot has `move_time` seconds per move, and `time_bank` seconds
+        in total for the game (plus `increment` after each move).
+        fallback(game, player) chooses the move played when a bot doesn't
+        answer in time. If `threads` is True, bots think in worker threads,
+        so the deadline holds even for bots that don't yield in time."""
+        self.move_time = move_time
+        self.time_bank = time_bank
+        self.increment = increment
+        self.fallback = fallback
+        self.threads = threads
+        self.banks = {}  # time left, by player name
+        self.stats = {}  # AgentStats, by player name
+
+    def remaining(self, player):
+        return self.banks.setdefault(player.name, self.time_bank)
+
+    def choose_move(self, game, player):
+        """Let the bot think until its deadline, and return its move"""
+        stats = self.stats.setdefault(player.name, AgentStats())
+        budget = max(min(self.move_time, self.remaining(player)), 0)
+        start = perf_counter()
+        deadline = start + budget
+        thoughts = []
+        if self.threads:
+            bot, position = stand_in(game, player)
+            bot.deadline = deadline
+            thread = Thread(target=collect_thoughts,
+                            args=(bot, position, deadline, thoughts),
+                            daemon=True)
+            thread.start()
+            thread.join(budget)
+        else:
+            player.deadline = deadline
+            try:
+                collect_thoughts(player, game, deadline, thoughts)
+            finally:
+                player.deadline = None
+        move = thoughts[-1] if thoughts else None
+        elapsed = perf_counter() - start
+        if elapsed > budget:
+            stats.overruns += 1
+        if move is None:
+            stats.fallbacks += 1
+            move = self.fallback(game, player)
+        stats.times.append(elapsed)
+        self.banks[player.name] = (self.remaining(player) - elapsed
+                                   + self.increment)
+        return move
+
+    def summary(self):
+        return {name: stats.summary() for name, stats in self.stats.items()}
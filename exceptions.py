@@ -2,4 +2,7 @@ class InvalidInputError(Exception):
     pass
 
 class IllegalMoveError(Exception):
-    pass
\ No newline at end of file
+    pass
+
+class OutOfTimeError(Exception):
+    pass
@@ -0,0 +1,238 @@
+"""Feature encoding of game positions for learned evaluation functions.
+
+features() turns many positions at once into a float32 matrix with one row
+per position, seen from the point of view of the player to move. Evaluators
+(linear, or a small multi-layer perceptron) score a whole matrix in one call,
+so a search can collect its leaf positions and evaluate them in a single
+batch instead of paying Python overhead per leaf. ValueBot collects its
+leaves with a FeatureWriter, which reuses the features that leaves share, so
+extracting features costs no more than SearchBot's evaluation.
+
+Requires NumPy.
+"""
+from math import inf
+from time import perf_counter
+import numpy as np
+from bots import SearchBot
+from exceptions import OutOfTimeError
+
+goods = ("diamond", "gold", "silver", "cloth", "spice", "leather")
+market_cards = goods + ("camel",)
+combos = ("combo3", "combo4", "combo5")
+token_slots = 9  # values of the top tokens of each resource stack (0 if none)
+
+feature_names = ([f"hand_{card}" for card in goods]
+                 + ["herd", "opponent_hand", "opponent_herd"]
+                 + [f"market_{card}" for card in market_cards]
+                 + [f"{card}_token_{i}" for card in goods
+                    for i in range(token_slots)]
+                 + [f"{combo}_tokens" for combo in combos]
+                 + ["deck", "points", "opponent_points"])
+
+
+class FeatureWriter():
+    """Collects the features of the leaves of a search, for a matrix.
+
+    Leaves share most of their hands and token stacks, so those features are
+    cached: hands by their cards, and token features by the heights of the
+    token stacks. The latter is safe as long as tokens are only taken from
+    and put back on the stacks (as make_move and unmake_move do) while the
+    writer is in use."""
+
+    def __init__(self):
+        self.values = []
+        self.rows = 0
+        self.games = {}  # token stacks and cached token features, by game id
+        self.tops = {}  # values of the top tokens, by stack id and height
+        self.hands = {}  # counts of each goods, by hand
+
+    def token_features(self, game):
+        """Values of the top resource tokens, then bonus token counts"""
+        cached = self.games.get(id(game))
+        if cached is None:
+            stacks = [*game.resource_tokens.values(),
+                      *game.bonus_tokens.values()]
+            cached = self.games[id(game)] = stacks, {}
+        stacks, cache = cached
+        key = tuple(map(len, stacks))
+        features = cache.get(key)
+        if features is None:
+            features = []
+            for card in goods:
+                features += self.top_values(game.resource_tokens.get(card, ()))
+            features += [len(game.bonus_tokens.get(combo, ()))
+                         for combo in combos]
+            features = cache[key] = tuple(features)
+        return features
+
+    def hand_counts(self, hand):
+        key = tuple(hand)
+        counts = self.hands.get(key)
+        if counts is None:
+            counts = self.hands[key] = tuple(map(hand.count, goods))
+        return counts
+
+    def top_values(self, stack):
+        key = id(stack), len(stack)
+        values = self.tops.get(key)
+        if values is None:
+            values = [token.value for token in stack[:-token_slots - 1:-1]]
+            values = self.tops[key] = values + [0] * (token_slots - len(values))
+        return values
+
+    def add(self, game, player):
+        """Add the features of the position, from `player`'s point of view.
+        Returns the index of its row."""
+        opponent = game.opponent(player)
+        row = self.values
+        row += self.hand_counts(player.hand)
+        row += len(player.herd), len(opponent.hand), len(opponent.herd)
+        row.extend(map(game.marketplace.count, market_cards))
+        row += self.token_features(game)
+        row += len(game.deck), player.points, opponent.points
+        self.rows += 1
+        return self.rows - 1
+
+    def matrix(self):
+        """The rows so far as a float32 matrix"""
+        return to_matrix(self.values)
+
+
+def feature_row(game, player):
+    """List of features of the position, from `player`'s point of view"""
+    opponent = game.opponent(player)
+    row = [player.hand.count(card) for card in goods]
+    row += [len(player.herd), len(opponent.hand), len(opponent.herd)]
+    row += [game.marketplace.count(card) for card in market_cards]
+    for card in goods:
+        stack = game.resource_tokens.get(card, ())
+        values = [token.value for token in stack[:-token_slots - 1:-1]]
+        row += values + [0] * (token_slots - len(values))
+    row += [len(game.bonus_tokens.get(combo, ())) for combo in combos]
+    row += [len(game.deck), player.points, opponent.points]
+    return row
+
+
+def to_matrix(values):
+    """Float32 matrix from rows of features joined into one list. Features
+    are whole numbers, so they are converted via bytes when they all fit in a
+    byte, which is much faster than converting them one by one."""
+    try:
+        matrix = np.frombuffer(bytes(values), dtype=np.uint8)
+    except ValueError:  # house rules with large token values
+        matrix = np.array(values)
+    return matrix.astype(np.float32).reshape(-1, len(feature_names))
+
+
+def features(games, players=None):
+    """Return a float32 matrix of features with one row per game. Each row is
+    from the point of view of the player to move, or of players[i] if given.
+    """
+    if players is None:
+        players = [game.players[game.current_player % 2] for game in games]
+    values = []
+    for game, player in zip(games, players):
+        values += feature_row(game, player)
+    return to_matrix(values)
+
+
+class LinearEvaluator():
+    """Scores positions as features @ weights + bias"""
+
+    def __init__(self, weights, bias=0.0):
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.bias = np.float32(bias)
+
+    def __call__(self, matrix):
+        return matrix @ self.weights + self.bias
+
+
+class MLPEvaluator():
+    """Multi-layer perceptron with ReLU hidden layers and a single output.
+    `layers` is a list of (weights, bias) pairs, from input to output."""
+
+    def __init__(self, layers):
+        self.layers = [(np.asarray(weights, dtype=np.float32),
+                        np.asarray(bias, dtype=np.float32))
+                       for weights, bias in layers]
+
+    def __call__(self, matrix):
+        for weights, bias in self.layers[:-1]:
+            matrix = np.maximum(matrix @ weights + bias, 0)
+        weights, bias = self.layers[-1]
+        return (matrix @ weights + bias).reshape(-1)
+
+
+def default_evaluator():
+    """Hand-tuned linear evaluator: points, plus rough values for goods in
+    hand and camels in the herd"""
+    values = {"points": 1, "opponent_points": -1, "herd": 0.2,
+              "opponent_herd": -0.2, "hand_diamond": 3, "hand_gold": 2.5,
+              "hand_silver": 2.5, "hand_cloth": 1, "hand_spice": 1,
+              "hand_leather": 0.5}
+    return LinearEvaluator([values.get(name, 0) for name in feature_names])
+
+
+def evaluate_batch(evaluator, games, players=None):
+    """Score many positions with one call to the evaluator"""
+    return evaluator(features(games, players))
+
+
+class ValueBot(SearchBot):
+    """SearchBot whose leaf positions are scored in one batch by a learned
+    evaluator. The search tree is expanded first (collecting leaf features),
+    then every leaf is evaluated at once and the values are backed up."""
+
+    def __init__(self, name, seed=None, depth=2, evaluator=None):
+        super().__init__(name, seed=seed, depth=depth)
+        self.evaluator = default_evaluator() if evaluator is None else evaluator
+
+    def expand(self, game, player, depth, leaves):
+        """Return the search tree below this position: a leaf's row in
+        `leaves` (a FeatureWriter), a range of rows if every move leads to a
+        leaf, or a list of subtrees (one per legal move)"""
+        if self.deadline is not None and perf_counter() > self.deadline:
+            raise OutOfTimeError
+        if depth == 0 or game.check_for_game_over():
+            return leaves.add(game, player)
+        opponent = game.opponent(player)
+        if depth == 1:
+            start = leaves.rows
+            for move in game.legal_moves(player):
+                undo = game.make_move(player, move)
+                try:
+                    leaves.add(game, opponent)
+                finally:
+                    game.unmake_move(undo)
+            return range(start, leaves.rows)
+        tree = []
+        for move in game.legal_moves(player):
+            undo = game.make_move(player, move)
+            try:
+                tree.append(self.expand(game, opponent, depth - 1, leaves))
+            finally:
+                game.unmake_move(undo)
+        return tree
+
+    def back_up(self, tree, values):
+        """Negamax value of a tree. A position with no legal moves is lost
+        (-inf), as in SearchBot.search."""
+        if isinstance(tree, int):
+            return values[tree]
+        if isinstance(tree, range):
+            return -min(values[tree.start:tree.stop], default=inf)
+        return max((-self.back_up(subtree, values) for subtree in tree),
+                   default=-inf)
+
+    def search_moves(self, game, player, moves, depth):
+        opponent = game.opponent(player)
+        leaves, trees = FeatureWriter(), []
+        for move in moves:
+            undo = game.make_move(player, move)
+            try:
+                trees.append(self.expand(game, opponent, depth - 1, leaves))
+            finally:
+                game.unmake_move(undo)
+        values = self.evaluator(leaves.matrix()).tolist()
+        return [(move, -self.back_up(tree, values))
+                for move, tree in zip(moves, trees)]
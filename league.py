@@ -0,0 +1,245 @@
+"""Round-robin league for bots.
+
+Every cycle, each entrant plays every other entrant twice (once in each seat).
+Matches are played in parallel worker processes and the Elo and TrueSkill
+ratings are updated incrementally as the results come in. Ratings and the
+match history are kept in a SQLite file, so an interrupted league picks up
+where it left off.
+"""
+import os
+import sqlite3
+from math import sqrt
+from multiprocessing import Pool
+from statistics import NormalDist
+from classes import Game
+
+initial_elo = 1500.0
+elo_k = 16.0
+# TrueSkill defaults (from the original paper)
+initial_mu = 25.0
+initial_sigma = initial_mu / 3
+beta = initial_sigma / 2
+tau = initial_sigma / 100
+draw_probability = 0.1
+
+normal = NormalDist()
+
+schema = """
+CREATE TABLE IF NOT EXISTS ratings (
+    name TEXT PRIMARY KEY,
+    elo REAL NOT NULL,
+    mu REAL NOT NULL,
+    sigma REAL NOT NULL,
+    wins INTEGER NOT NULL DEFAULT 0,
+    draws INTEGER NOT NULL DEFAULT 0,
+    losses INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS matches (
+    cycle INTEGER NOT NULL,
+    player1 TEXT NOT NULL,
+    player2 TEXT NOT NULL,
+    seed INTEGER NOT NULL,
+    victory_points1 INTEGER NOT NULL,
+    victory_points2 INTEGER NOT NULL,
+    PRIMARY KEY (cycle, player1, player2)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS progress (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    cycle INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO progress VALUES (0, 0);
+"""
+
+
+def expected_score(rating, other_rating):
+    return 1 / (1 + 10 ** ((other_rating - rating) / 400))
+
+
+def elo_update(rating1, rating2, score1, k=elo_k):
+    """Return the new Elo ratings of two players after a game in which player 1
+    scored `score1` (1 for a win, 0.5 for a draw, 0 for a loss)"""
+    delta = k * (score1 - expected_score(rating1, rating2))
+    return rating1 + delta, rating2 - delta
+
+
+def trueskill_update(rating1, rating2, score1):
+    """Return the new TrueSkill ratings (mu, sigma) of two players after a game
+    in which player 1 scored `score1` (1 for a win, 0.5 for a draw, 0 for a
+    loss)"""
+    if score1 == 0:
+        rating2, rating1 = trueskill_update(rating2, rating1, 1)
+        return rating1, rating2
+    (mu1, sigma1), (mu2, sigma2) = rating1, rating2
+    variance1 = sigma1 ** 2 + tau ** 2
+    variance2 = sigma2 ** 2 + tau ** 2
+    c = sqrt(2 * beta ** 2 + variance1 + variance2)
+    t = (mu1 - mu2) / c
+    epsilon = normal.inv_cdf((draw_probability + 1) / 2) * sqrt(2) * beta / c
+    if score1 == 1:
+        denominator = normal.cdf(t - epsilon)
+        if denominator < 1e-12:  # extremely surprising result
+            v = epsilon - t
+        else:
+            v = normal.pdf(t - epsilon) / denominator
+        w = v * (v + t - epsilon)
+    else:
+        denominator = normal.cdf(epsilon - t) - normal.cdf(-epsilon - t)
+        v = (normal.pdf(-epsilon - t) - normal.pdf(epsilon - t)) / denominator
+        w = v ** 2 + ((epsilon - t) * normal.pdf(epsilon - t)
+                      + (epsilon + t) * normal.pdf(epsilon + t)) / denominator
+    mu1 += variance1 / c * v
+    mu2 -= variance2 / c * v
+    sigma1 = sqrt(variance1 * max(1 - variance1 / c ** 2 * w, 1e-6))
+    sigma2 = sqrt(variance2 * max(1 - variance2 / c ** 2 * w, 1e-6))
+    return (mu1, sigma1), (mu2, sigma2)
+
+
+def round_robin(names):
+    """Return the list of (player1, player2) pairings for one cycle. Uses the
+    circle method, so each entrant plays at most once per round of pairings,
+    then repeats every pairing with the seats swapped."""
+    names = sorted(names)
+    if len(names) % 2:
+        names.append(None)  # bye
+    half = len(names) // 2
+    pairings = []
+    for __ in range(len(names) - 1):
+        for a, b in zip(names[:half], reversed(names[half:])):
+            if a is not None and b is not None:
+                pairings.append((a, b))
+        names.insert(1, names.pop())  # rotate everyone but the first entrant
+    return pairings + [(b, a) for a, b in pairings]
+
+
+# bot factories, set in each worker process by init_worker
+entrants = {}
+
+
+def init_worker(league_entrants):
+    entrants.clear()
+    entrants.update(league_entrants)
+
+
+def play_match(match):
+    """Play one match between two entrants. Runs in a worker process."""
+    cycle, player1, player2, seed = match
+    game = Game(entrants[player1](player1, seed=seed),
+                entrants[player2](player2, seed=seed),
+                seed=seed, verbose=False)
+    game.play_game()
+    return (cycle, player1, player2, seed,
+            game.player1.victory_points, game.player2.victory_points)
+
+
+class League():
+    """Round-robin league between bots.
+    `entrants` maps each entrant's name to a bot factory (usually a Bot
+    subclass, or a functools.partial of one) that is called with the name and
+    a seed. Factories must be picklable so they can be sent to the workers.
+    """
+
+    def __init__(self, path, entrants, seed=0):
+        self.entrants = dict(entrants)
+        self.schedule = round_robin(self.entrants)
+        self.seed = seed
+        self.db = sqlite3.connect(path)
+        self.db.executescript(schema)
+        with self.db:
+            self.db.executemany(
+                "INSERT OR IGNORE INTO ratings (name, elo, mu, sigma) "
+                "VALUES (?, ?, ?, ?)",
+                [(name, initial_elo, initial_mu, initial_sigma)
+                 for name in self.entrants])
+        self.ratings = {}
+        for name, *rating in self.db.execute(
+                "SELECT name, elo, mu, sigma, wins, draws, losses FROM ratings"):
+            self.ratings[name] = rating
+
+    def close(self):
+        self.db.close()
+
+    @property
+    def first_unfinished_cycle(self):
+        cycle, = self.db.execute("SELECT cycle FROM progress").fetchone()
+        return cycle
+
+    def pending(self, cycles):
+        """List the matches still to be played in the first `cycles` cycles.
+        Only the unfinished cycles are read from the database."""
+        matches = []
+        for cycle in range(self.first_unfinished_cycle, cycles):
+            played = set(self.db.execute(
+                "SELECT player1, player2 FROM matches WHERE cycle = ?",
+                (cycle,)))
+            for index, (player1, player2) in enumerate(self.schedule):
+                if (player1, player2) not in played:
+                    seed = self.seed + cycle * len(self.schedule) + index
+                    matches.append((cycle, player1, player2, seed))
+        return matches
+
+    def rate(self, result):
+        """Update the in-memory ratings with the result of one match"""
+        __, player1, player2, __, points1, points2 = result
+        rating1, rating2 = self.ratings[player1], self.ratings[player2]
+        score1 = 1 if points1 > points2 else 0 if points1 < points2 else 0.5
+        rating1[0], rating2[0] = elo_update(rating1[0], rating2[0], score1)
+        (rating1[1], rating1[2]), (rating2[1], rating2[2]) = trueskill_update(
+            (rating1[1], rating1[2]), (rating2[1], rating2[2]), score1)
+        outcome = {1: 3, 0.5: 4, 0: 5}  # index of wins, draws, losses
+        rating1[outcome[score1]] += 1
+        rating2[outcome[1 - score1]] += 1
+
+    def save(self, results):
+        """Write a batch of results and the updated ratings in one
+        transaction"""
+        if not results:
+            return
+        names = {name for result in results for name in result[1:3]}
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO matches VALUES (?, ?, ?, ?, ?, ?)",
+                results)
+            self.db.executemany(
+                "UPDATE ratings SET elo = ?, mu = ?, sigma = ?, wins = ?, "
+                "draws = ?, losses = ? WHERE name = ?",
+                [(*self.ratings[name], name) for name in names])
+            # move the progress marker past any cycles that are now complete
+            cycle = self.first_unfinished_cycle
+            while True:
+                played, = self.db.execute(
+                    "SELECT COUNT(*) FROM matches WHERE cycle = ?",
+                    (cycle,)).fetchone()
+                if played < len(self.schedule):
+                    break
+                cycle += 1
+            self.db.execute("UPDATE progress SET cycle = ?", (cycle,))
+
+    def run(self, cycles, processes=None, batch_size=500):
+        """Play all the outstanding matches in the first `cycles` cycles. If
+        processes is 1, the matches are played in this process."""
+        matches = self.pending(cycles)
+        if processes == 1:
+            init_worker(self.entrants)
+            self.collect(map(play_match, matches), batch_size)
+        else:
+            processes = processes or os.cpu_count()
+            chunksize = max(1, min(64, len(matches) // (4 * processes)))
+            with Pool(processes, init_worker, (self.entrants,)) as pool:
+                self.collect(pool.imap_unordered(play_match, matches, chunksize),
+                             batch_size)
+
+    def collect(self, results, batch_size):
+        batch = []
+        for result in results:
+            self.rate(result)
+            batch.append(result)
+            if len(batch) >= batch_size:
+                self.save(batch)
+                batch = []
+        self.save(batch)
+
+    def standings(self):
+        """List (name, elo, mu, sigma, wins, draws, losses) for every entrant,
+        best Elo first"""
+        return sorted(((name, *rating) for name, rating in self.ratings.items()),
+                      key=lambda row: row[1], reverse=True)
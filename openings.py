@@ -0,0 +1,240 @@
+"""Opening book for the first move of a round.
+
+At the start of a round the marketplace holds 3 camels and 2 other cards and
+each player has 4 cards, so there are only a few thousand distinct openings
+(market multiset x own hand multiset). generate_book finds the best first move
+for each one by self-play and writes them to a sorted binary table.
+OpeningBook memory-maps that table and looks openings up with a binary
+search, so every process shares the same pages and the first move is instant.
+
+Generate a book with:
+    python openings.py book.bin --rollouts 20
+"""
+import argparse
+import mmap
+import struct
+from multiprocessing import Pool
+from random import Random
+from bots import GreedyBot, SearchBot
+from classes import Deck, Marketplace, Game
+from utilities import sub_multisets
+
+card_types = ("camel", "cloth", "diamond", "gold", "leather", "silver", "spice")
+actions = ("buy", "sell", "trade", "camels")
+
+magic = b"JAIPURBK"
+header = struct.Struct("<8sI")
+key_size = 2 * len(card_types)
+record = struct.Struct(f"<{key_size}sB{len(card_types)}B{len(card_types)}B")
+
+
+def opening_deck_size(deck_contents=None):
+    """Cards left in the deck before the first move of a round"""
+    return len(Deck(default=True, **(deck_contents or {}))) - 5 - 2 * 4
+
+
+def counts(cards):
+    return [cards.count(card) for card in card_types]
+
+
+def expand(card_counts):
+    """Inverse of counts: a sorted list of cards"""
+    return [card for card, amount in zip(card_types, card_counts)
+            for __ in range(amount)]
+
+
+def opening_key(market, cards):
+    """Book key for a marketplace and the cards (hand and herd) of the player
+    to move"""
+    return bytes(counts(list(market)) + counts(list(cards)))
+
+
+def encode_move(move):
+    """Pack a move tuple as (action, cards given, cards taken)"""
+    action, *details = move
+    given, taken = [], []
+    if action == "buy":
+        taken = details
+    elif action == "sell":
+        goods, amount = details
+        given = [goods] * amount
+    elif action == "trade":
+        given, taken = details
+    return (actions.index(action), *counts(given), *counts(taken))
+
+
+def decode_move(action, given, taken):
+    action = actions[action]
+    if action == "buy":
+        return action, expand(taken)[0]
+    elif action == "sell":
+        goods = expand(given)
+        return action, goods[0], len(goods)
+    elif action == "trade":
+        return action, expand(given), expand(taken)
+    return action,
+
+
+def openings():
+    """List every (market, hand) opening. Hands may include camels."""
+    kinds = list(card_types)
+    return [(["camel"] * 3 + market, hand)
+            for market in sub_multisets(sorted(kinds * 2), 2)
+            for hand in sub_multisets(sorted(kinds * 4), 4)]
+
+
+def deal_opening(game, market, hand, rng):
+    """Set up a round of `game` so player 1 is to move in the given opening.
+    The rest of the deck and player 2's hand are dealt at random."""
+    game.setup_round()
+    game.deck = Deck(default=True, **game.deck_contents)
+    for card in market + hand:
+        game.deck.remove(card)
+    game.deck.shuffle(rng)
+    game.marketplace = Marketplace(market)
+    for player in game.players:
+        player.reset()
+    game.player1.give(hand)
+    game.player2.give(game.deck.draw(4))
+    game.current_player = 0
+
+
+def rollout(market, hand, move, rng):
+    """Play the move in the opening, then play out the round with greedy bots.
+    Returns player 1's lead in points at the end of the round."""
+    game = Game(GreedyBot("Player 1", seed=rng.random()),
+                GreedyBot("Player 2", seed=rng.random()),
+                seed=rng.random(), verbose=False)
+    deal_opening(game, market, hand, rng)
+    game.make_move(game.player1, move)
+    game.current_player = 1
+    game.play_turns()
+    herd_bonus = 5 if len(game.player1.herd) > len(game.player2.herd) else -5
+    return game.player1.points - game.player2.points + herd_bonus
+
+
+def best_opening_move(job):
+    """Find the move with the best mean rollout score in one opening. Runs in
+    a worker process."""
+    market, hand, rollouts, seed = job
+    rng = Random(seed)
+    game = Game(verbose=False)
+    deal_opening(game, market, hand, rng)
+    best_move, best_score = None, None
+    for move in game.legal_moves(game.player1):
+        score = sum(rollout(market, hand, move, rng) for __ in range(rollouts))
+        if best_score is None or score > best_score:
+            best_move, best_score = move, score
+    return record.pack(opening_key(market, hand), *encode_move(best_move))
+
+
+def generate_book(path, rollouts=20, processes=None, seed=0):
+    """Compute the best first move for every opening by parallel self-play
+    and write the opening book to `path`"""
+    jobs = [(market, hand, rollouts, seed + i)
+            for i, (market, hand) in enumerate(openings())]
+    with Pool(processes) as pool:
+        write_book(path, pool.imap_unordered(best_opening_move, jobs, 8))
+
+
+def write_book(path, records):
+    """Write packed book records to `path`, sorted by key"""
+    records = sorted(records)
+    with open(path, "wb") as file:
+        file.write(header.pack(magic, len(records)))
+        file.writelines(records)
+
+
+class OpeningBook():
+    """Read-only, memory-mapped opening book written by generate_book"""
+
+    def __init__(self, path):
+        with open(path, "rb") as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        file_magic, self.size = header.unpack_from(self.map)
+        if file_magic != magic:
+            raise ValueError(f"{path} is not an opening book")
+
+    def close(self):
+        self.map.close()
+
+    def __len__(self):
+        return self.size
+
+    def key(self, index):
+        offset = header.size + index * record.size
+        return self.map[offset:offset + key_size]
+
+    def lookup(self, market, cards):
+        """Return the book move for the player holding `cards` (hand and
+        herd), or None if the position isn't in the book"""
+        key = opening_key(market, cards)
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) // 2
+            if self.key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low == self.size or self.key(low) != key:
+            return None
+        __, action, *move = record.unpack_from(
+            self.map, header.size + low * record.size)
+        return decode_move(action, move[:len(card_types)],
+                           move[len(card_types):])
+
+
+# opening books already mapped in this process, by path
+books = {}
+
+
+def load_book(path):
+    if path not in books:
+        books[path] = OpeningBook(path)
+    return books[path]
+
+
+class BookBot(SearchBot):
+    """SearchBot that plays its first move of a round from an opening book"""
+
+    def __init__(self, name, seed=None, depth=2, book=None):
+        super().__init__(name, seed=seed, depth=depth)
+        self.book = None if book is None else load_book(book)
+
+    def book_move(self, game):
+        """The book's move for this position, or None if it isn't the first
+        move of a round or isn't in the book. (The book is only for the first
+        mover: after a sale or a trade the deck is unchanged, but the tokens
+        or the opponent's cards aren't what the book assumed.)"""
+        if self.book is None or len(game.history) != game.round_start:
+            return None
+        stacks = {**game.resource_tokens, **game.bonus_tokens}
+        schedules = {**game.resource_schedule, **game.bonus_schedule}
+        if (len(game.deck) != opening_deck_size(game.deck_contents)
+                or any(len(stack) != len(schedules[key])
+                       for key, stack in stacks.items())
+                or len(self.hand) + len(self.herd) != 4):
+            return None
+        return self.book.lookup(game.marketplace, self.hand + self.herd)
+
+    def choose_move(self, game):
+        move = self.book_move(game)
+        return super().choose_move(game) if move is None else move
+
+    def think(self, game):
+        move = self.book_move(game)
+        if move is None:
+            yield from super().think(game)
+        else:
+            yield move
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate an opening book")
+    parser.add_argument("path")
+    parser.add_argument("--rollouts", type=int, default=20)
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    arguments = parser.parse_args()
+    generate_book(arguments.path, arguments.rollouts, arguments.processes,
+                  arguments.seed)
@@ -0,0 +1,118 @@
+"""Pondering: thinking on the opponent's time.
+
+While a human opponent decides on their move, a PonderingBot works through
+their most likely replies in a background thread. For each reply it plays
+the move on its own copy of the game, searches for its best answer and
+caches it under the encoded state of the resulting position (without the
+move history, which only depends on how the position was reached). When the real
+move arrives and the position matches one it analysed, the bot answers
+straight from the cache, so the longer the opponent thinks, the faster the
+bot replies.
+
+The pondering thread never touches the bot's own random number generator.
+Each position is searched with a generator seeded from the position and one
+number drawn when pondering starts (once per opponent turn, however often
+they retry their move), and a position that wasn't pondered is
+searched the same way, so the bot's moves don't depend on how long the
+opponent took.
+"""
+from random import Random
+from threading import Thread
+from bots import SearchBot
+from exceptions import OutOfTimeError
+from serialization import encode_game, decode_game
+
+
+class PonderingBot(SearchBot):
+    def __init__(self, name, seed=None, depth=2):
+        super().__init__(name, seed=seed, depth=depth)
+        self.cache = {}  # best move, by encoded position
+        self.thread = None
+        # drawn from self.random once per opponent turn, when pondering starts
+        self.ponder_seed = None
+        self.hits = 0
+        self.misses = 0
+
+    def likely_replies(self, game, opponent):
+        """Opponent's legal moves, most likely first (by the greedy
+        heuristic)"""
+        moves = game.legal_moves(opponent)
+        moves.sort(key=lambda move: self.score_move(game, move), reverse=True)
+        return moves
+
+    def start_pondering(self, game):
+        self.stop_pondering()
+        if self.ponder_seed is None:  # not when the opponent retries a move
+            self.ponder_seed = self.random.random()
+        copy = decode_game(encode_game(game))
+        self.thread = Thread(target=self.ponder, args=(copy,), daemon=True)
+        self.thread.start()
+
+    def stop_pondering(self):
+        if self.thread is None:
+            return
+        self.deadline = 0  # make the search stop at the next node
+        self.thread.join()
+        self.thread = None
+        self.deadline = None
+
+    def ponder(self, game):
+        """Analyse the positions after the opponent's likely replies. Runs in
+        the background thread on a copy of the game."""
+        opponent = game.players[game.current_player % 2]
+        me = game.opponent(opponent)
+        try:
+            for reply in self.likely_replies(game, opponent):
+                undo = game.make_move(opponent, reply)
+                game.current_player += 1
+                try:
+                    key = encode_game(game, history=False)
+                    if key not in self.cache and not game.check_for_game_over():
+                        self.cache[key] = self.best_move(game, me, key)
+                finally:
+                    game.current_player -= 1
+                    game.unmake_move(undo)
+        except OutOfTimeError:
+            pass
+
+    def best_move(self, game, player, key):
+        """Search the position (encoded as `key`) as pondering does"""
+        rng = Random(f"{self.ponder_seed}:{key.hex()}")
+        values = self.move_values(game, player, rng=rng)
+        return max(values, key=lambda value: value[1])[0]
+
+    def cached_move(self, game):
+        """The pondered move for this position (or None), emptying the cache
+        because the other positions can't come up any more"""
+        move = self.cache.get(encode_game(game, history=False))
+        self.cache = {}
+        if move is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return move
+
+    def choose_move(self, game):
+        move = self.cached_move(game)
+        if move is None and self.ponder_seed is not None:
+            move = self.best_move(game, self, encode_game(game, history=False))
+        self.ponder_seed = None
+        return super().choose_move(game) if move is None else move
+
+    def stand_in(self, game):
+        """Settle the cache, hit counts and ponder seed here, and give the
+        copy just the pondered move for this position"""
+        move = self.cached_move(game)
+        bot = super().stand_in(game)
+        bot.cache = {} if move is None else \
+            {encode_game(game, history=False): move}
+        self.ponder_seed = None
+        return bot
+
+    def think(self, game):
+        move = self.cached_move(game)
+        self.ponder_seed = None
+        if move is None:
+            yield from super().think(game)
+        else:
+            yield move
@@ -0,0 +1,145 @@
+"""Compact binary encoding of a Game.
+
+Cards are stored as one byte each and tokens as three (a byte for the name
+and two for the value, as house rules may use large values), so a whole
+game in progress takes a couple of hundred bytes instead of the thousands of
+Python objects a live Game holds. The moves played so far (Game.history) are
+kept as one line of text per move. House rules are only stored if they differ
+from the defaults. Players come back as plain Players (or as the player
+objects passed to decode_game); anything else about them is not stored.
+"""
+import json
+import struct
+from classes import (Game, Player, Token, Deck, TokenStack, Marketplace,
+                     allowed_token_names, default_resource_tokens,
+                     default_bonus_tokens)
+
+version = 4
+card_types = ("camel", "cloth", "diamond", "gold", "leather", "silver", "spice")
+# version, round, current player, moves before this round, flags
+numbers = struct.Struct("<BBIIB")
+token = struct.Struct("<BH")  # name, value
+has_round, verbose, has_seed, has_history = 1, 2, 4, 8
+
+
+class Writer():
+    def __init__(self):
+        self.parts = []
+
+    def bytes(self, data):
+        self.parts.append(struct.pack("<H", len(data)))
+        self.parts.append(data)
+
+    def text(self, string):
+        self.bytes(string.encode())
+
+    def cards(self, cards):
+        self.bytes(bytes(card_types.index(card) for card in cards))
+
+    def tokens(self, tokens):
+        self.bytes(b"".join(token.pack(allowed_token_names.index(item.name),
+                                       item.value) for item in tokens))
+
+    def getvalue(self):
+        return b"".join(self.parts)
+
+
+class Reader():
+    def __init__(self, data, offset=0):
+        self.data = data
+        self.offset = offset
+
+    def bytes(self):
+        length, = struct.unpack_from("<H", self.data, self.offset)
+        start = self.offset + 2
+        self.offset = start + length
+        return self.data[start:self.offset]
+
+    def text(self):
+        return self.bytes().decode()
+
+    def cards(self):
+        return [card_types[byte] for byte in self.bytes()]
+
+    def tokens(self):
+        return [Token(allowed_token_names[name], value)
+                for name, value in token.iter_unpack(self.bytes())]
+
+
+def encode_game(game, history=True):
+    """Encode the state of a game as bytes. With history=False the moves
+    played so far are left out, so equal positions encode equally."""
+    flags = ((has_round if hasattr(game, "deck") else 0)
+             | (verbose if game.verbose else 0)
+             | (has_seed if game.seed is not None else 0)
+             | (has_history if history else 0))
+    writer = Writer()
+    writer.parts.append(numbers.pack(version, game.round, game.current_player,
+                                     game.round_start, flags))
+    # rules (only the differences from the defaults)
+    rules = [game.deck_contents,
+             {key: values for key, values in game.resource_schedule.items()
+              if default_resource_tokens.get(key) != values},
+             {key: values for key, values in game.bonus_schedule.items()
+              if default_bonus_tokens.get(key) != values}]
+    writer.text(json.dumps(rules, separators=(",", ":")) if any(rules) else "")
+    # a round's shuffles only depend on str(seed), so that's all we keep
+    writer.text("" if game.seed is None else str(game.seed))
+    for player in game.players:
+        writer.text(player.name)
+        writer.bytes(bytes([player.victory_points]))
+        writer.cards(player.hand)
+        writer.cards(player.herd)
+        writer.tokens(player.tokens)
+    if flags & has_round:
+        writer.cards(game.deck)
+        writer.cards(game.marketplace)
+        for stacks in (game.resource_tokens, game.bonus_tokens):
+            for stack in stacks.values():
+                writer.tokens(stack)
+    if flags & has_history:
+        writer.text("\n".join(game.history))
+    return writer.getvalue()
+
+
+def decode_game(data, player1=None, player2=None):
+    """Rebuild a Game from encode_game's bytes. The given players (if any) are
+    used instead of new Players, and have their cards and tokens restored."""
+    data_version, round, current_player, round_start, flags = \
+        numbers.unpack_from(data)
+    if data_version != version:
+        raise ValueError(f"Unsupported game encoding version {data_version}")
+    reader = Reader(data, numbers.size)
+    rules = reader.text()
+    deck, resource_tokens, bonus_tokens = json.loads(rules) if rules else \
+        ({}, {}, {})
+    seed = reader.text()
+    players = [player1, player2]
+    for i, player in enumerate(players):
+        name = reader.text()
+        if player is None:
+            player = players[i] = Player(name)
+        player.victory_points, = reader.bytes()
+        player.hand = Deck()
+        player.hand.extend(reader.cards())
+        player.herd = Deck()
+        player.herd.extend(reader.cards())
+        player.tokens = reader.tokens()
+    game = Game(*players, seed=seed if flags & has_seed else None,
+                verbose=bool(flags & verbose), deck=deck,
+                resource_tokens=resource_tokens, bonus_tokens=bonus_tokens)
+    game.round = round
+    game.current_player = current_player
+    game.round_start = round_start
+    if flags & has_round:
+        game.deck = Deck()
+        game.deck.extend(reader.cards())
+        game.marketplace = Marketplace(reader.cards())
+        game.resource_tokens = {key: TokenStack(*reader.tokens())
+                                for key in game.resource_schedule}
+        game.bonus_tokens = {key: TokenStack(*reader.tokens())
+                             for key in game.bonus_schedule}
+    if flags & has_history:
+        history = reader.text()
+        game.history = history.split("\n") if history else []
+    return game
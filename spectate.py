@@ -0,0 +1,113 @@
+"""Spectator broadcasting for a running game.
+
+A SpectatorChannel watches a Game. Every time the game's state changes it
+encodes one frame (JSON bytes, with the players' hands reduced to card counts
+and their face-down bonus tokens to how many they hold)
+and hands the same frame to every subscriber's bounded asyncio queue. A
+subscriber that falls behind loses its oldest frames rather than slowing the
+game down, so the cost per move doesn't depend on the number of spectators.
+"""
+import asyncio
+import json
+
+goods = ("diamond", "gold", "silver", "cloth", "spice", "leather")
+combos = ("combo3", "combo4", "combo5")
+
+
+def encode_frame(game, sequence):
+    """Public view of the game as JSON bytes: hands are redacted to their
+    size and bonus tokens (which are face down) to how many there are"""
+    players = [{"name": player.name,
+                "victory_points": player.victory_points,
+                "hand": len(player.hand),
+                "herd": len(player.herd),
+                "tokens": [token.value for token in player.tokens
+                           if token.name in goods],
+                "bonus_tokens": sum(token.name in combos
+                                    for token in player.tokens),
+                "largest_herd": any(token.name == "largest_herd"
+                                    for token in player.tokens),
+                } for player in game.players]
+    frame = {"sequence": sequence,
+             "round": game.round,
+             "turn": game.players[game.current_player % 2].name,
+             "players": players,
+             }
+    if hasattr(game, "deck"):
+        frame.update(
+            marketplace=list(game.marketplace),
+            deck=len(game.deck),
+            resource_tokens={goods: stack.get_values()
+                             for goods, stack in game.resource_tokens.items()},
+            bonus_tokens={combo: len(stack)
+                          for combo, stack in game.bonus_tokens.items()},
+            last_move=game.history[-1] if game.history else None,
+        )
+    return json.dumps(frame, separators=(",", ":")).encode()
+
+
+class SpectatorChannel():
+    def __init__(self, game, max_queue=16, loop=None):
+        """Broadcast `game` to subscribers. Each subscriber's queue holds at
+        most `max_queue` frames. If the game is played in another thread,
+        pass the event loop the subscribers run on as `loop`."""
+        self.game = game
+        self.max_queue = max_queue
+        self.loop = loop
+        self.subscribers = set()
+        self.sequence = 0
+        self.frame = None  # latest frame, sent to new subscribers
+        self.dropped = 0
+        game.observers.append(self.publish)
+
+    def subscribe(self):
+        """Return a new subscriber queue, starting with the latest frame.
+        Must be called on the event loop."""
+        queue = asyncio.Queue(self.max_queue)
+        if self.frame is not None:
+            queue.put_nowait(self.frame)
+        self.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        self.subscribers.discard(queue)
+
+    def publish(self, game=None):
+        """Encode the current state once and send it to every subscriber.
+        The channel follows the game it is called with, which is a new object
+        after a hibernated table has been woken up (see TableManager)."""
+        if game is not None:
+            self.game = game
+        self.sequence += 1
+        self.frame = encode_frame(self.game, self.sequence)
+        if self.loop is None:
+            self.fan_out(self.frame)
+        else:
+            self.loop.call_soon_threadsafe(self.fan_out, self.frame)
+
+    def fan_out(self, frame):
+        for queue in self.subscribers:
+            if queue.full():  # slow consumer: drop its oldest frame
+                queue.get_nowait()
+                self.dropped += 1
+            queue.put_nowait(frame)
+
+    def close(self):
+        """Stop watching the game and end every subscriber's stream"""
+        self.game.observers.remove(self.publish)
+        if self.loop is None:
+            self.fan_out(None)
+        else:
+            self.loop.call_soon_threadsafe(self.fan_out, None)
+
+    async def frames(self):
+        """Async iterator over frames for one subscriber, until closed"""
+        queue = self.subscribe()
+        try:
+            while True:
+                frame = await queue.get()
+                if frame is None:
+                    return
+                yield frame
+        finally:
+            self.unsubscribe(queue)
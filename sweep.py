@@ -0,0 +1,155 @@
+"""Parameter sweeps over house-rule variants.
+
+A variant is a set of keyword arguments for Game (deck, resource_tokens,
+bonus_tokens). Each variant is played by the same fixed bots, one round at a
+time, alternating which bot moves first. Rounds are played in batches in a
+process pool and every variant uses the same seeds.
+
+After each batch, a sequential probability ratio test (SPRT) on the first
+player's win rate decides whether the variant is clearly unbalanced (dropped),
+clearly balanced (finished early) or still undecided (plays another batch, up
+to max_rounds).
+"""
+import itertools
+from math import log
+from multiprocessing import Pool
+from statistics import mean, pstdev, quantiles
+from bots import GreedyBot
+from classes import Game
+
+
+def variant_grid(deck=None, resource_tokens=None, bonus_tokens=None):
+    """Return the list of variants for every combination of options.
+    Each argument maps a card or token stack name to a list of options, e.g.
+        variant_grid(deck={"camel": [8, 11]},
+                     bonus_tokens={"combo5": [[8, 8, 9, 10, 10], [6, 7, 8]]})
+    gives four variants."""
+    sections = {"deck": deck or {}, "resource_tokens": resource_tokens or {},
+                "bonus_tokens": bonus_tokens or {}}
+    axes = [(section, name, options)
+            for section, overrides in sections.items()
+            for name, options in overrides.items()]
+    variants = []
+    for choice in itertools.product(*(options for __, __, options in axes)):
+        variant = {section: {} for section in sections}
+        for (section, name, __), value in zip(axes, choice):
+            variant[section][name] = value
+        variants.append(variant)
+    return variants
+
+
+def play_rounds(job):
+    """Play a batch of single rounds of one variant. Returns the index of the
+    variant and a list of (first player's points, second player's points).
+    Runs in a worker process."""
+    index, variant, bots, seeds = job
+    results = []
+    for seed in seeds:
+        game = Game(bots[0]("Player 1", seed=seed),
+                    bots[1]("Player 2", seed=seed),
+                    seed=seed, verbose=False, **variant)
+        game.current_player = seed % 2  # alternate who moves first
+        first, second = (game.player1, game.player2)[::1 - 2 * (seed % 2)]
+        game.setup_round()
+        game.play_turns()
+        game.end_round()
+        results.append((first.points, second.points))
+    return index, results
+
+
+class VariantResult():
+    """Running statistics for one variant"""
+
+    def __init__(self, variant):
+        self.variant = variant
+        self.first_points = []
+        self.second_points = []
+        self.status = "undecided"
+
+    def record(self, results):
+        for first, second in results:
+            self.first_points.append(first)
+            self.second_points.append(second)
+
+    @property
+    def rounds(self):
+        return len(self.first_points)
+
+    @property
+    def first_player_wins(self):
+        """Rounds won by the first player (draws count as half)"""
+        return sum(1 if first > second else 0.5 if first == second else 0
+                   for first, second in zip(self.first_points,
+                                            self.second_points))
+
+    @property
+    def first_player_advantage(self):
+        """First player's win rate minus 0.5"""
+        return self.first_player_wins / self.rounds - 0.5 if self.rounds else 0
+
+    def sprt(self, delta, alpha, beta):
+        """Test H0: the first player wins half the time against H1: the first
+        player's win rate is off by at least delta (in either direction)"""
+        wins = self.first_player_wins
+        losses = self.rounds - wins
+        upper = log((1 - beta) / alpha)
+        lower = log(beta / (1 - alpha))
+        ratios = [wins * log(p / 0.5) + losses * log((1 - p) / 0.5)
+                  for p in (0.5 + delta, 0.5 - delta)]
+        if max(ratios) >= upper:
+            self.status = "unbalanced"
+        elif max(ratios) <= lower:
+            self.status = "balanced"
+
+    def report(self):
+        def distribution(points):
+            quartiles = (quantiles(points, n=4, method="inclusive")
+                         if len(points) > 1 else points * 3)
+            return {"mean": mean(points) if points else 0,
+                    "stdev": pstdev(points) if points else 0,
+                    "quartiles": quartiles}
+        return {**self.variant,
+                "status": self.status,
+                "rounds": self.rounds,
+                "first_player_advantage": self.first_player_advantage,
+                "first_player_points": distribution(self.first_points),
+                "second_player_points": distribution(self.second_points),
+                }
+
+
+def sweep(variants, bots=(GreedyBot, GreedyBot), batch_size=50,
+          max_rounds=2000, delta=0.1, alpha=0.05, beta=0.05, processes=None,
+          seed=0):
+    """Play every variant until its SPRT decides it or it has played
+    max_rounds rounds, and return a report for each one.
+    `bots` are two picklable bot factories. delta is the smallest first player
+    advantage that counts as unbalanced; alpha and beta are the error rates of
+    the test. If processes is 1, the rounds are played in this process."""
+    results = [VariantResult(variant) for variant in variants]
+    if processes == 1:
+        play_batches(results, map, bots, batch_size, max_rounds, delta, alpha,
+                     beta, seed)
+    else:
+        with Pool(processes) as pool:
+            play_batches(results, pool.imap_unordered, bots, batch_size,
+                         max_rounds, delta, alpha, beta, seed)
+    return [result.report() for result in results]
+
+
+def play_batches(results, map_jobs, bots, batch_size, max_rounds, delta,
+                 alpha, beta, seed):
+    """Play batches of rounds until every variant is decided or has played
+    max_rounds rounds. `map_jobs` is map or a pool's imap_unordered."""
+    while True:
+        jobs = []
+        for index, result in enumerate(results):
+            if result.status == "undecided" and result.rounds < max_rounds:
+                start = seed + result.rounds
+                size = min(batch_size, max_rounds - result.rounds)
+                jobs.append((index, result.variant, bots,
+                             range(start, start + size)))
+        if not jobs:
+            break
+        for index, rounds in map_jobs(play_rounds, jobs):
+            results[index].record(rounds)
+            results[index].sprt(delta, alpha, beta)
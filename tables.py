@@ -0,0 +1,112 @@
+"""Keeps many tables (games) on a server without keeping them all in memory.
+
+Only the most recently used tables are kept as live Game objects. The rest
+hibernate as compact encoded bytes (compressed with zlib), either in memory
+or in files in a directory, and are restored transparently the next time they are used.
+A game's observers (e.g. spectator channels) can't be encoded, so they are
+kept in memory while it hibernates and handed to the game when it wakes up.
+"""
+import os
+import zlib
+from collections import OrderedDict
+from exceptions import IllegalMoveError
+from serialization import encode_game, decode_game
+from utilities import parse_player_input
+
+
+class TableManager():
+    def __init__(self, capacity=100, directory=None):
+        """Keep at most `capacity` live games (at least 1, the game being
+        played). Hibernating games are kept in memory, or in `directory` if
+        one is given."""
+        if capacity < 1:
+            raise ValueError("At least one table must be kept live")
+        self.capacity = capacity
+        self.directory = directory
+        self.live = OrderedDict()  # least recently used first
+        self.hibernating = {}  # only used if there's no directory
+        self.observers = {}  # observers of hibernating games, by table id
+        self.finished = set()  # ids of tables whose game is over
+
+    def __len__(self):
+        return len(self.live) + len(self.hibernating_ids())
+
+    def __contains__(self, table_id):
+        return table_id in self.live or self.is_hibernating(table_id)
+
+    def path(self, table_id):
+        return os.path.join(self.directory, f"{table_id}.jaipur")
+
+    def hibernating_ids(self):
+        if self.directory is None:
+            return list(self.hibernating)
+        return [name[:-len(".jaipur")] for name in os.listdir(self.directory)
+                if name.endswith(".jaipur")]
+
+    def is_hibernating(self, table_id):
+        if self.directory is None:
+            return table_id in self.hibernating
+        return os.path.exists(self.path(table_id))
+
+    def add(self, table_id, game):
+        """Start managing a game. Table ids are used in file names if games
+        are stored on disk."""
+        if table_id in self:
+            raise KeyError(f"There is already a table {table_id}")
+        self.live[table_id] = game
+        self.evict()
+
+    def remove(self, table_id):
+        """Stop managing a table and return its game"""
+        game = self.get(table_id)
+        del self.live[table_id]
+        self.finished.discard(table_id)
+        return game
+
+    def get(self, table_id):
+        """Return the live game at a table, waking it up if necessary"""
+        if table_id in self.live:
+            self.live.move_to_end(table_id)
+            return self.live[table_id]
+        if self.directory is None:
+            data = self.hibernating.pop(table_id)
+        else:
+            with open(self.path(table_id), "rb") as file:
+                data = file.read()
+            os.remove(self.path(table_id))
+        game = self.live[table_id] = decode_game(zlib.decompress(data))
+        game.observers = self.observers.pop(table_id, game.observers)
+        self.evict()
+        return game
+
+    def hibernate(self, table_id):
+        """Encode a live game and drop the live objects"""
+        game = self.live.pop(table_id)
+        data = zlib.compress(encode_game(game))
+        if game.observers:
+            self.observers[table_id] = game.observers
+        if self.directory is None:
+            self.hibernating[table_id] = data
+        else:
+            with open(self.path(table_id), "wb") as file:
+                file.write(data)
+
+    def evict(self):
+        while len(self.live) > self.capacity:
+            table_id = next(iter(self.live))
+            self.hibernate(table_id)
+
+    def play(self, table_id, command):
+        """Play a command (e.g. "buy gold") for the player whose turn it is at
+        a table. Raises IllegalMoveError or InvalidInputError if the command
+        can't be played (or the game is over). Returns False once the game is
+        over."""
+        if table_id in self.finished:
+            raise IllegalMoveError(f"The game at table {table_id} is over")
+        game = self.get(table_id)
+        player = game.players[game.current_player % 2]
+        game.play_move(player, parse_player_input(command))
+        if game.next_turn():
+            return True
+        self.finished.add(table_id)
+        return False
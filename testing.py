@@ -1,7 +1,29 @@
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
 import unittest
-from classes import Token, Deck
-from utilities import parse_player_input, parse_card_group
+try:
+    import numpy
+except ImportError:
+    numpy = None
+from classes import Token, Deck, Game
+from utilities import parse_player_input, parse_card_group, format_move
 from exceptions import InvalidInputError, IllegalMoveError
+from bots import RandomBot, GreedyBot, SearchBot
+from league import League, elo_update, trueskill_update, round_robin
+from sweep import variant_grid, sweep
+from serialization import encode_game, decode_game
+from tables import TableManager
+from analysis import game_record, replay, analyse
+from spectate import SpectatorChannel, encode_frame
+from batch import ScriptRunner
+from clock import TurnClock, AgentStats
+from ponder import PonderingBot
+from openings import (OpeningBook, BookBot, openings, best_opening_move,
+                      write_book, deal_opening)
 
 class TestToken(unittest.TestCase):
 
@@ -335,5 +357,699 @@ class Test_parse_card_group(unittest.TestCase):
         self.assertEqual(cards, {"camel": None, "leather": 1})
 
 
+class TestGame(unittest.TestCase):
+
+    def setUp(self):
+        self.game = Game(RandomBot("a", seed=1), RandomBot("b", seed=2),
+                         seed=3, verbose=False)
+        self.game.setup_round()
+
+    def test_legal_moves_are_legal(self):
+        for __ in range(30):
+            player = self.game.players[self.game.current_player % 2]
+            moves = self.game.legal_moves(player)
+            self.assertTrue(moves)
+            for move in moves:
+                # every move should parse back to itself
+                self.assertEqual(tuple(parse_player_input(format_move(move))),
+                                 tuple(move))
+            self.game.player_turn()
+            self.game.current_player += 1
+
+    def test_seeded_games_are_reproducible(self):
+        games = [Game(GreedyBot("a", seed=1), RandomBot("b", seed=1),
+                      seed=7, verbose=False) for __ in range(2)]
+        winners = [game.play_game().name for game in games]
+        self.assertEqual(winners[0], winners[1])
+        self.assertEqual(repr(games[0]), repr(games[1]))
+
+    def test_unmake_move_restores_state(self):
+        def snapshot(game):
+            return (repr(game), [list(p.hand) for p in game.players],
+                    list(game.deck), list(game.marketplace),
+                    {k: list(v) for k, v in game.resource_tokens.items()},
+                    {k: list(v) for k, v in game.bonus_tokens.items()})
+
+        undos, snapshots = [], [snapshot(self.game)]
+        while not self.game.check_for_game_over():
+            player = self.game.players[len(undos) % 2]
+            move = player.random.choice(self.game.legal_moves(player))
+            undos.append(self.game.make_move(player, move))
+            snapshots.append(snapshot(self.game))
+        while undos:
+            snapshots.pop()
+            self.game.unmake_move(undos.pop())
+            self.assertEqual(snapshot(self.game), snapshots[-1])
+
+    def test_search_bot_leaves_game_unchanged(self):
+        bot = SearchBot("search", seed=1, depth=2)
+        game = Game(bot, RandomBot("b"), seed=3, verbose=False)
+        game.setup_round()
+        before = (repr(game), list(game.deck), list(game.marketplace))
+        move = bot.choose_move(game)
+        self.assertIn(move, game.legal_moves(bot))
+        self.assertEqual((repr(game), list(game.deck), list(game.marketplace)),
+                         before)
+
+
+class TestLeague(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "league.sqlite")
+        self.entrants = {"random": RandomBot, "greedy": GreedyBot,
+                         "random2": RandomBot}
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_round_robin(self):
+        pairings = round_robin(["a", "b", "c"])
+        self.assertEqual(len(pairings), 6)
+        self.assertEqual(len(set(pairings)), 6)
+
+    def test_ratings(self):
+        self.assertEqual(elo_update(1500, 1500, 1), (1508, 1492))
+        (mu1, sigma1), (mu2, sigma2) = trueskill_update((25, 8), (25, 8), 1)
+        self.assertGreater(mu1, 25)
+        self.assertLess(mu2, 25)
+        self.assertLess(sigma1, 8)
+        (mu1, __), (mu2, __) = trueskill_update((30, 2), (20, 2), 0.5)
+        self.assertLess(mu1, 30)
+        self.assertGreater(mu2, 20)
+
+    def test_resume(self):
+        league = League(self.path, self.entrants)
+        league.run(cycles=1, processes=1)
+        self.assertEqual(league.first_unfinished_cycle, 1)
+        self.assertEqual(league.pending(1), [])
+        league.close()
+
+        league = League(self.path, self.entrants)
+        self.assertEqual(len(league.pending(2)), 6)
+        games = sum(sum(row[4:]) for row in league.standings())
+        self.assertEqual(games, 12)  # two entrants per match
+        league.close()
+
+
+class TestOpeningBook(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "book.bin")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_lookup(self):
+        sample = openings()[::700]
+        write_book(self.path, [best_opening_move((market, hand, 1, 0))
+                               for market, hand in sample])
+        book = OpeningBook(self.path)
+        self.assertEqual(len(book), len(sample))
+        for market, hand in sample:
+            game = Game(verbose=False)
+            deal_opening(game, market, hand, game.round_random())
+            move = book.lookup(market, hand)
+            self.assertIn(move, game.legal_moves(game.player1))
+        self.assertIsNone(book.lookup(["camel"] * 5, ["gold"] * 4))
+        book.close()
+
+    def test_book_bot_under_clock(self):
+        sample = openings()[::1400]
+        write_book(self.path, [best_opening_move((market, hand, 1, 0))
+                               for market, hand in sample])
+        bot = BookBot("book", seed=1, book=self.path)
+        clock = TurnClock(move_time=10)
+        for market, hand in sample:
+            game = Game(bot, RandomBot("random", seed=1), verbose=False)
+            deal_opening(game, market, hand, game.round_random())
+            move = bot.book.lookup(market, hand)
+            self.assertEqual(list(bot.think(game)), [move])
+            self.assertEqual(clock.choose_move(game, bot), move)
+        self.assertEqual(clock.stats["book"].fallbacks, 0)
+        # the book is used with house-rule decks too
+        market, hand = sample[0]
+        game = Game(bot, RandomBot("random", seed=1), verbose=False,
+                    deck={"camel": 12})
+        deal_opening(game, market, hand, game.round_random())
+        self.assertEqual(bot.book_move(game), bot.book.lookup(market, hand))
+        # but only for the first move of the round: not for the second mover
+        # after a trade, which leaves the deck and the tokens as they were
+        game = Game(RandomBot("random", seed=1), bot, verbose=False)
+        deal_opening(game, ["camel"] * 3 + ["gold", "silver"],
+                     ["cloth", "cloth", "spice", "leather"],
+                     game.round_random())
+        trade = next(move for move in game.legal_moves(game.player1)
+                     if move[0] == "trade")
+        game.play_move(game.player1, trade)
+        game.current_player = 1
+        self.assertIsNone(bot.book_move(game))
+        bot.book.close()
+
+
+class TestSweep(unittest.TestCase):
+
+    def test_variant_grid(self):
+        variants = variant_grid(deck={"camel": [8, 11]},
+                                bonus_tokens={"combo5": [[8, 8], [6, 7, 8]]})
+        self.assertEqual(len(variants), 4)
+        self.assertIn({"deck": {"camel": 8}, "resource_tokens": {},
+                       "bonus_tokens": {"combo5": [6, 7, 8]}}, variants)
+
+    def test_variant_rules(self):
+        game = Game(verbose=False, deck={"camel": 5},
+                    resource_tokens={"diamond": [9, 9]})
+        game.setup_round()
+        self.assertEqual(game.resource_tokens["diamond"].get_values(), [9, 9])
+        self.assertEqual(game.resource_tokens["gold"].get_values(),
+                         [5, 5, 5, 6, 6])
+        cards = game.deck + game.marketplace + game.player1.herd + \
+            game.player2.herd
+        self.assertEqual(cards.count("camel"), 5)
+
+    def test_sweep(self):
+        report, = sweep(variant_grid(), batch_size=10, max_rounds=20,
+                        processes=1)
+        self.assertIn(report["status"], ("undecided", "balanced",
+                                         "unbalanced"))
+        self.assertLessEqual(report["rounds"], 20)
+        self.assertEqual(len(report["first_player_points"]["quartiles"]), 3)
+
+    def test_max_rounds(self):
+        # ten rounds can't decide delta=0.01, so every variant plays them all
+        reports = sweep(variant_grid(deck={"camel": [8, 11]}), batch_size=7,
+                        max_rounds=10, delta=0.01, processes=1)
+        self.assertEqual([report["rounds"] for report in reports], [10, 10])
+        report, = sweep(variant_grid(), batch_size=1, max_rounds=1,
+                        processes=1)
+        self.assertEqual(report["rounds"], 1)
+        self.assertEqual(len(report["first_player_points"]["quartiles"]), 3)
+
+
+class TestTables(unittest.TestCase):
+
+    def new_game(self, seed):
+        game = Game(seed=seed, verbose=False)
+        game.setup_round()
+        return game
+
+    def play(self, game, turns):
+        for __ in range(turns):
+            player = game.players[game.current_player % 2]
+            game.play_move(player, game.legal_moves(player)[0])
+            if not game.next_turn():
+                break
+
+    def test_encoding_round_trip(self):
+        game = Game(seed=4, verbose=False, bonus_tokens={"combo5": [7, 7]})
+        game.setup_round()
+        self.play(game, 15)
+        copy = decode_game(encode_game(game))
+        self.assertEqual(repr(copy), repr(game))
+        self.assertEqual(encode_game(copy), encode_game(game))
+        self.assertEqual(copy.bonus_schedule["combo5"], [7, 7])
+        self.assertEqual(len(copy.history), 15)
+        self.assertEqual(copy.history, game.history)
+        self.assertNotEqual(encode_game(game, history=False),
+                            encode_game(game))
+        # house rules may use token values that don't fit in a byte
+        game = Game(seed=4, verbose=False, resource_tokens={"gold": [300, 7]})
+        game.setup_round()
+        game.player1.tokens.append(game.resource_tokens["gold"].pop())
+        copy = decode_game(encode_game(game))
+        self.assertEqual(repr(copy), repr(game))
+        self.assertEqual(copy.player1.points, 300)
+        # the restored game plays on (into later rounds) exactly as the original
+        self.play(game, 200)
+        self.play(copy, 200)
+        self.assertEqual(encode_game(copy), encode_game(game))
+
+    def test_capacity(self):
+        with self.assertRaises(ValueError):
+            TableManager(capacity=0)
+        manager = TableManager(capacity=1)
+        manager.add("a", self.new_game(1))
+        manager.add("b", self.new_game(2))
+        self.assertTrue(manager.is_hibernating("a"))
+        manager.play("a", "camels")
+        self.assertEqual(list(manager.live), ["a"])
+
+    def test_finished_table(self):
+        manager = TableManager(capacity=1)
+        manager.add("a", self.new_game(1))
+        game = manager.get("a")
+        while True:
+            player = game.players[game.current_player % 2]
+            if not manager.play("a", format_move(game.legal_moves(player)[0])):
+                break
+            manager.add(f"other {len(manager)}", self.new_game(2))
+            game = manager.get("a")  # woken up after hibernating
+        points = [player.victory_points for player in game.players]
+        player = game.players[game.current_player % 2]
+        with self.assertRaises(IllegalMoveError):
+            manager.play("a", format_move(game.legal_moves(player)[0]))
+        self.assertEqual([player.victory_points for player in game.players],
+                         points)
+
+    def test_table_manager(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for manager in (TableManager(capacity=2),
+                            TableManager(capacity=2, directory=directory)):
+                expected = {}
+                for table_id in range(5):
+                    manager.add(table_id, self.new_game(table_id))
+                    expected[table_id] = self.new_game(table_id)
+                self.assertEqual(len(manager.live), 2)
+                self.assertEqual(len(manager), 5)
+                for table_id in (0, 3, 0, 1, 4):
+                    game = expected[table_id]
+                    player = game.players[game.current_player % 2]
+                    manager.play(table_id,
+                                 format_move(game.legal_moves(player)[0]))
+                    self.play(game, 1)
+                    self.assertLessEqual(len(manager.live), 2)
+                for table_id, game in expected.items():
+                    self.assertEqual(repr(manager.get(table_id)), repr(game))
+                    self.assertIn(table_id, manager.live)
+                    self.assertEqual(manager.get(table_id).history,
+                                     game.history)
+
+
+@unittest.skipIf(numpy is None, "requires NumPy")
+class TestFeatures(unittest.TestCase):
+
+    def setUp(self):
+        self.games = []
+        for seed in range(5):
+            game = Game(seed=seed, verbose=False)
+            game.setup_round()
+            self.games.append(game)
+
+    def test_features(self):
+        from features import features, feature_names
+        matrix = features(self.games)
+        self.assertEqual(matrix.dtype, numpy.float32)
+        self.assertEqual(matrix.shape, (5, len(feature_names)))
+        row = dict(zip(feature_names, matrix[0]))
+        self.assertEqual(row["deck"], 42)
+        self.assertEqual(row["market_camel"], 3)
+        self.assertEqual(row["diamond_token_0"], 7)
+        self.assertEqual(row["leather_token_8"], 1)
+        self.assertEqual(row["combo5_tokens"], 5)
+
+    def test_evaluators(self):
+        from features import (features, feature_names, evaluate_batch,
+                              LinearEvaluator, MLPEvaluator)
+        weights = numpy.arange(len(feature_names), dtype=numpy.float32)
+        linear = LinearEvaluator(weights, bias=1)
+        mlp = MLPEvaluator([(numpy.eye(len(feature_names)),
+                             numpy.zeros(len(feature_names))),
+                            (weights, 1)])
+        expected = features(self.games) @ weights + 1
+        numpy.testing.assert_allclose(evaluate_batch(linear, self.games),
+                                      expected)
+        numpy.testing.assert_allclose(evaluate_batch(mlp, self.games),
+                                      expected)
+
+    def test_feature_writer(self):
+        from features import FeatureWriter, feature_row
+        game = Game(seed=1, verbose=False, resource_tokens={"gold": [300, 7]})
+        game.setup_round()
+        player, opponent = game.players
+        writer, rows = FeatureWriter(), []
+        for move in game.legal_moves(player):
+            undo = game.make_move(player, move)
+            for reply in game.legal_moves(opponent):
+                undo_reply = game.make_move(opponent, reply)
+                writer.add(game, player)
+                rows.append(feature_row(game, player))
+                game.unmake_move(undo_reply)
+            game.unmake_move(undo)
+        numpy.testing.assert_array_equal(writer.matrix(),
+                                         numpy.array(rows, numpy.float32))
+        self.assertEqual(writer.matrix().dtype, numpy.float32)
+
+    def test_value_bot(self):
+        from features import ValueBot
+        bot = ValueBot("value", seed=1)
+        game = Game(bot, RandomBot("random", seed=1), seed=2, verbose=False)
+        game.setup_round()
+        self.assertIn(bot.choose_move(game), game.legal_moves(bot))
+        # a position without legal moves is lost, as in SearchBot.search
+        self.assertEqual(bot.back_up([], []), -float("inf"))
+        self.assertEqual(bot.back_up(range(0), []), -float("inf"))
+
+
+class TestAnalysis(unittest.TestCase):
+
+    def setUp(self):
+        self.game = Game(GreedyBot("a", seed=1), RandomBot("b", seed=1),
+                         seed=5, verbose=False)
+        self.game.play_game()
+        self.record = game_record(self.game, id="game")
+
+    def test_replay(self):
+        for game, player, move in replay(self.record):
+            pass
+        self.assertEqual(game.history, self.game.history)
+        for original, replayed in zip(self.game.players, game.players):
+            self.assertEqual(original.victory_points, replayed.victory_points)
+            self.assertEqual(repr(original.tokens), repr(replayed.tokens))
+
+    def test_analyse(self):
+        report, = analyse([self.record], depth=1, processes=1)
+        self.assertEqual(report["id"], "game")
+        self.assertEqual(len(report["moves"]), len(self.game.history))
+        self.assertTrue(all(move["regret"] >= 0 for move in report["moves"]))
+        self.assertEqual(report["blunders"],
+                         sum(move["blunder"] for move in report["moves"]))
+
+    def test_bad_records(self):
+        illegal = dict(self.record, id="illegal")
+        illegal["moves"] = illegal["moves"][:3] + ["buy pineapple"]
+        records = [{"id": "pineapple", "seed": 1, "moves": ["buy pineapple"]},
+                   illegal, {"id": "no moves", "seed": 1}, self.record]
+        reports = {report["id"]: report
+                   for report in analyse(records, depth=1, processes=1)}
+        self.assertEqual(reports["pineapple"]["move_index"], 0)
+        self.assertEqual(reports["pineapple"]["error"],
+                         "There is no pineapple in the marketplace.")
+        self.assertEqual(reports["illegal"]["move_index"], 3)
+        self.assertIsNone(reports["no moves"]["move_index"])
+        self.assertNotIn("error", reports["game"])
+        report, = analyse(["not json"], processes=1)
+        self.assertIn("error", report)
+
+    def test_moves_after_game_over(self):
+        record = dict(self.record, moves=self.record["moves"] + ["camels"])
+        report, = analyse([record], depth=1, processes=1)
+        self.assertEqual(report["error"], "The game is over")
+        self.assertEqual(report["move_index"], len(self.game.history))
+        for record in ({"seed": 1, "moves": "camels"}, ["camels"],
+                       dict(self.record, rules={"camels": 8})):
+            report, = analyse([record], processes=1)
+            self.assertIsNone(report["move_index"])
+
+
+class TestSpectate(unittest.TestCase):
+
+    def test_fan_out(self):
+        async def watch():
+            game = Game(RandomBot("a", seed=1), RandomBot("b", seed=2),
+                        seed=3, verbose=False)
+            channel = SpectatorChannel(game, max_queue=3)
+            fast, slow = channel.subscribe(), channel.subscribe()
+            game.setup_round()
+            received = [fast.get_nowait()]
+            for __ in range(10):
+                game.player_turn()
+                game.next_turn()
+                received.append(fast.get_nowait())
+            channel.close()
+            return channel, received, slow
+
+        channel, received, slow = asyncio.run(watch())
+        self.assertEqual(channel.sequence, 11)  # one frame per state change
+        frame = json.loads(received[-1])
+        self.assertEqual(frame["sequence"], 11)
+        self.assertIsInstance(frame["players"][0]["hand"], int)
+        self.assertEqual(len(frame["marketplace"]), 5)
+        # the slow subscriber only kept the latest frames, shared with the
+        # fast one, and the end of stream marker
+        self.assertEqual([slow.get_nowait() for __ in range(3)],
+                         [received[-2], received[-1], None])
+        self.assertIs(received[-1], channel.frame)
+        self.assertEqual(channel.dropped, 9)
+
+    def test_hibernated_table(self):
+        manager = TableManager(capacity=1)
+        game = Game(seed=3, verbose=False)
+        game.setup_round()
+        manager.add("watched", game)
+        channel = SpectatorChannel(game)
+        queue = channel.subscribe()
+        manager.add("other", Game(seed=4, verbose=False))
+        self.assertTrue(manager.is_hibernating("watched"))
+        player = game.players[game.current_player % 2]
+        manager.play("watched", format_move(game.legal_moves(player)[0]))
+        woken = manager.get("watched")
+        self.assertIsNot(woken, game)
+        self.assertIs(channel.game, woken)
+        frame = json.loads(queue.get_nowait())
+        self.assertEqual(frame["last_move"], woken.history[-1])
+        channel.close()
+        self.assertEqual(woken.observers, [])
+
+    def test_bonus_tokens_are_hidden(self):
+        game = Game(seed=3, verbose=False)
+        game.setup_round()
+        game.player1.tokens += [Token("gold", 6), Token("combo4", 5),
+                                Token("combo3", 2)]
+        player = json.loads(encode_frame(game, 1))["players"][0]
+        self.assertEqual(player["tokens"], [6])
+        self.assertEqual(player["bonus_tokens"], 2)
+        self.assertFalse(player["largest_herd"])
+
+
+class TestBatch(unittest.TestCase):
+
+    def test_script(self):
+        game = Game(GreedyBot("a", seed=2), RandomBot("b", seed=2), seed=9,
+                    verbose=False)
+        winner = game.play_game()
+        script = ["# a recorded game", "seed 9", "buy pineapple",
+                  *game.history, "camels", "", "seed 10", "sell camel"]
+        output = []
+        runner = ScriptRunner(output.append, buffer_lines=7)
+        runner.run(script)
+        lines = "".join(output).splitlines()
+        end = len(game.history) + 3  # line number of the last move
+        self.assertEqual(lines[0], "error 1:3: There is no pineapple in the "
+                                   "marketplace.")
+        self.assertEqual(lines[1:len(game.history) + 1],
+                         ["ok"] * len(game.history))
+        self.assertEqual(lines[len(game.history) + 1:],
+                         [f"error 1:{end + 1}: the game is over",
+                          f"result {game.player1.victory_points} "
+                          f"{game.player2.victory_points} Player "
+                          f"{game.players.index(winner) + 1}",
+                          f"error 2:{end + 4}: You can't sell camels",
+                          "result 0 0 none"])
+        self.assertEqual((runner.games, runner.errors), (2, 3))
+        # line numbers start again in each script
+        output.clear()
+        runner.run(["", "camels"])
+        self.assertEqual(output, ["error 0:2: no game started (expected a "
+                                  "seed line)\n"])
+
+
+class SlowBot(RandomBot):
+    def think(self, game):
+        time.sleep(0.05)
+        yield self.choose_move(game)
+
+
+class StuckBot(RandomBot):
+    """Thinks without ever yielding until `release` is set"""
+
+    def __init__(self, name, seed=None):
+        super().__init__(name, seed=seed)
+        self.release = threading.Event()
+        self.done = threading.Event()
+
+    def think(self, game):
+        self.release.wait()
+        game.player1.hand.clear()  # too late: the clock has moved on
+        self.done.set()
+        yield self.choose_move(game)
+
+
+class TestClock(unittest.TestCase):
+
+    def setUp(self):
+        self.game = Game(SearchBot("search", seed=1, depth=4), SlowBot("slow"),
+                         seed=1, verbose=False)
+        self.game.setup_round()
+
+    def test_deadline(self):
+        clock = TurnClock(move_time=0.01, time_bank=1)
+        bot = self.game.player1
+        before = (repr(self.game), list(self.game.deck))
+        move = clock.choose_move(self.game, bot)
+        self.assertIn(move, self.game.legal_moves(bot))
+        self.assertEqual((repr(self.game), list(self.game.deck)), before)
+        stats = clock.summary()["search"]
+        # a depth 4 search takes far longer: it was stopped at the deadline,
+        # having come up with a move, and the time came out of the bank
+        self.assertEqual((stats["moves"], stats["fallbacks"]), (1, 0))
+        self.assertLess(clock.banks["search"], 1)
+        self.assertAlmostEqual(clock.banks["search"], 1 - stats["total"])
+        self.assertIsNone(bot.deadline)
+
+    def test_fallback(self):
+        clock = TurnClock(move_time=0.01, time_bank=1)
+        slow = self.game.player2
+        move = clock.choose_move(self.game, slow)
+        self.assertEqual(move, self.game.legal_moves(slow)[0])
+        stats = clock.summary()["slow"]
+        self.assertEqual((stats["fallbacks"], stats["overruns"]), (1, 1))
+
+    def test_time_bank(self):
+        clock = TurnClock(move_time=1, time_bank=0)
+        game = Game(SearchBot("search", seed=1), RandomBot("random"), seed=1,
+                    verbose=False, clock=clock)
+        game.setup_round()
+        game.play_turns()
+        stats = clock.summary()["search"]
+        self.assertEqual(stats["fallbacks"], stats["moves"])
+
+    def test_threads(self):
+        clock = TurnClock(move_time=0.01, time_bank=1, threads=True)
+        stuck = StuckBot("stuck")
+        game = Game(self.game.player1, stuck, seed=1, verbose=False)
+        game.setup_round()
+        game.current_player = 1
+        before = repr(game)
+        move = clock.choose_move(game, stuck)
+        stuck.release.set()
+        self.assertTrue(stuck.done.wait(5))
+        self.assertEqual(move, game.legal_moves(stuck)[0])
+        self.assertEqual(clock.stats["stuck"].fallbacks, 1)
+        self.assertEqual(repr(game), before)
+        # bots that do answer in time are played as usual
+        clock = TurnClock(move_time=60, threads=True)
+        bot = SearchBot("search", seed=1, depth=1)
+        game = Game(bot, RandomBot("random"), seed=1, verbose=False)
+        game.setup_round()
+        before = repr(game)
+        self.assertIn(clock.choose_move(game, bot), game.legal_moves(bot))
+        self.assertEqual(clock.stats["search"].fallbacks, 0)
+        self.assertEqual(repr(game), before)
+
+    def test_percentiles(self):
+        stats = AgentStats()
+        stats.times = [2.0, 1.0]
+        summary = stats.summary()
+        self.assertEqual(summary["p50"], 1.5)
+        # percentiles stay within the measured times
+        self.assertAlmostEqual(summary["p95"], 1.95)
+        self.assertLessEqual(summary["p95"], summary["max"])
+
+
+class PatientHumanGame(Game):
+    """Game where player 1 is a human who waits for the bot to finish
+    pondering, then plays the move the bot thought most likely"""
+
+    def prompt_player_turn(self, player):
+        bot = self.opponent(player)
+        bot.thread.join(timeout=10)
+        return format_move(bot.likely_replies(self, player)[0])
+
+
+class HastyHumanGame(Game):
+    """PatientHumanGame where the human moves before the bot has pondered
+    anything"""
+
+    def prompt_player_turn(self, player):
+        bot = self.opponent(player)
+        bot.stop_pondering()
+        bot.cache = {}
+        return format_move(bot.likely_replies(self, player)[0])
+
+
+class TypoHumanGame(PatientHumanGame):
+    """PatientHumanGame where the human mistypes every move the first time"""
+
+    def prompt_player_turn(self, player):
+        self.typos = not getattr(self, "typos", False)
+        if self.typos:
+            return "by gold"
+        return super().prompt_player_turn(player)
+
+
+class TestPonder(unittest.TestCase):
+
+    def test_pondered_move_is_reused(self):
+        bot = PonderingBot("ponder", seed=1, depth=1)
+        game = PatientHumanGame(player2=bot, seed=2, verbose=False)
+        game.setup_round()
+        for turn in range(3):
+            game.player_turn()  # human
+            self.assertIsNone(bot.thread)
+            self.assertGreater(len(bot.cache), 1)
+            game.current_player += 1
+            before = repr(game)
+            move = bot.choose_move(game)
+            self.assertEqual(repr(game), before)
+            self.assertIn(move, game.legal_moves(bot))
+            self.assertEqual(bot.cache, {})
+            game.make_move(bot, move)
+            game.current_player += 1
+        self.assertEqual((bot.hits, bot.misses), (3, 0))
+
+    def test_moves_do_not_depend_on_thinking_time(self):
+        moves, hits = [], []
+        for game_class in (PatientHumanGame, HastyHumanGame):
+            bot = PonderingBot("ponder", seed=3, depth=2)
+            game = game_class(player2=bot, seed=2, verbose=False)
+            game.setup_round()
+            for turn in range(5):
+                game.player_turn()  # human
+                game.current_player += 1
+                game.player_turn()
+                game.current_player += 1
+            moves.append(game.history)
+            hits.append(bot.hits)
+        self.assertEqual(hits, [5, 0])
+        self.assertEqual(moves[0], moves[1])
+
+    def test_moves_do_not_depend_on_typos(self):
+        moves = []
+        for game_class in (PatientHumanGame, TypoHumanGame):
+            bot = PonderingBot("ponder", seed=3, depth=2)
+            game = game_class(player2=bot, seed=3, verbose=False)
+            game.setup_round()
+            for turn in range(5):
+                try:
+                    game.player_turn()  # human
+                except InvalidInputError:
+                    game.player_turn()
+                game.current_player += 1
+                game.player_turn()
+                game.current_player += 1
+            moves.append(game.history)
+        self.assertEqual(moves[0], moves[1])
+
+    def test_pondering_under_threaded_clock(self):
+        bot = PonderingBot("ponder", seed=1, depth=1)
+        clock = TurnClock(move_time=5, time_bank=60, threads=True)
+        game = PatientHumanGame(player2=bot, seed=2, verbose=False,
+                                clock=clock)
+        game.setup_round()
+        for turn in range(3):
+            game.player_turn()  # human
+            game.current_player += 1
+            self.assertIsNotNone(bot.ponder_seed)
+            game.player_turn()
+            game.current_player += 1
+            # settled on the real bot, not on its stand-in
+            self.assertEqual(bot.cache, {})
+            self.assertIsNone(bot.ponder_seed)
+        self.assertEqual((bot.hits, bot.misses), (3, 0))
+        self.assertEqual(clock.stats["ponder"].fallbacks, 0)
+
+    def test_stop_pondering_early(self):
+        bot = PonderingBot("ponder", seed=1, depth=3)
+        game = Game(player2=bot, seed=2, verbose=False)
+        game.setup_round()
+        before = repr(game)
+        bot.start_pondering(game)
+        bot.stop_pondering()
+        self.assertIsNone(bot.deadline)
+        self.assertEqual(repr(game), before)
+        self.assertIn(bot.choose_move(game), game.legal_moves(bot))
+
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -95,3 +95,47 @@ def parse_card_group(string_of_cards):
         else:
             d[card] = amount
     return d
+
+
+def format_card_group(cards):
+    """Inverse of parse_card_group: turn a list of cards into a string like
+    "2 camel 1 leather", keeping the order in which card types first appear"""
+    counts = {}
+    for card in cards:
+        counts[card] = counts.get(card, 0) + 1
+    return " ".join(f"{amount} {card}" for card, amount in counts.items())
+
+
+def format_move(move):
+    """Inverse of parse_player_input: turn a parsed move tuple back into a
+    command string"""
+    action, *details = move
+    if action == "buy":
+        card, = details
+        return f"buy {card}"
+    elif action == "sell":
+        goods, amount = details
+        return f"sell {goods}" if amount == "all" else f"sell {amount} {goods}"
+    elif action == "trade":
+        player_cards, market_cards = details
+        return (f"trade {format_card_group(player_cards)} "
+                f"for {format_card_group(market_cards)}")
+    elif action == "camels":
+        return "camels"
+    else:
+        raise InvalidInputError(f"Unrecognised action: {action}")
+
+
+def sub_multisets(cards, size):
+    """Yield every distinct sub-multiset (as a list) of `size` cards from the
+    list `cards`. The input should be sorted so duplicates are adjacent."""
+    if size == 0:
+        yield []
+        return
+    previous = None
+    for i, card in enumerate(cards):
+        if card == previous:
+            continue
+        previous = card
+        for rest in sub_multisets(cards[i+1:], size - 1):
+            yield [card] + rest